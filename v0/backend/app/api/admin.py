@@ -1,10 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from app.db import db
+from app.services.qr_export import stream_qr_zip
+from app.services.print_sheet import PrintLayout, PAGE_SIZES, iter_print_sheet_pdf, tile_data
+from app.services.qr_cache import qr_record_cache
+from app.services import metrics
+from app.services.gemini import model_router
+from starlette.concurrency import run_in_threadpool
 from nanoid import generate as nanoid
 from typing import Optional, Any, Dict, List
 import datetime
 import json
+import base64
 
 router = APIRouter()
 
@@ -35,6 +43,8 @@ async def create_qr_code(body: CreateQRRequest):
             "location": body.location,
             "metadata": json.dumps(body.metadata) if body.metadata else None
         })
+        # Drop a cached "not found" for this id
+        qr_record_cache.invalidate(qr_code.id)
         
         # In a real scenario URL logic might need adjustment based on environ
         visit_url = f"http://localhost:3000/visit/{qr_code.id}" 
@@ -53,44 +63,228 @@ async def create_qr_code(body: CreateQRRequest):
         print(f"Error creating QR: {e}")
         raise HTTPException(status_code=500, detail="Failed to create QR code")
 
+@router.get("/metrics")
+async def get_metrics():
+    return {"success": True, "metrics": metrics.snapshot()}
+
+@router.get("/models")
+async def get_model_stats():
+    # Listed in the order the next review request would try them
+    order = model_router.order(probe=False)
+    return {"success": True, "order": order, "models": model_router.snapshot()}
+
+# Per-QR analytics for one page of QR codes, aggregated in SQLite so the
+# cost follows the number of QR codes rather than the number of log rows.
+# Both run off covering indexes.
+SCAN_COUNTS_SQL = """
+SELECT "qrCodeId",
+       SUM("action" = 'scan') AS "scans",
+       SUM("action" = 'review_submitted') AS "submissions"
+FROM "ScanLog"
+WHERE "qrCodeId" IN ({ids}) AND "action" IN ('scan', 'review_submitted')
+GROUP BY "qrCodeId"
+"""
+
+REVIEW_STATS_SQL = """
+SELECT "qrCodeId", COUNT(*) AS "reviews", AVG("rating") AS "averageRating"
+FROM "Review"
+WHERE "qrCodeId" IN ({ids})
+GROUP BY "qrCodeId"
+"""
+
+# QR codes per database round trip; also the largest page a client can ask for
+LIST_PAGE_ROWS = 500
+
+def encode_list_cursor(qr) -> str:
+    payload = json.dumps({"createdAt": qr.createdAt.isoformat(), "id": qr.id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_list_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Turns a cursor into the where clause for the QR codes after it in
+    (createdAt desc, id desc) order.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        created_at = datetime.datetime.fromisoformat(payload["createdAt"])
+        qr_id = str(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"OR": [
+        {"createdAt": {"lt": created_at}},
+        {"createdAt": created_at, "id": {"lt": qr_id}},
+    ]}
+
+async def list_qr_code_rows(qr_codes) -> List[Dict[str, Any]]:
+    ids = [qr.id for qr in qr_codes]
+    if not ids:
+        return []
+    placeholders = ",".join("?" * len(ids))
+    scan_counts = {row["qrCodeId"]: row for row in await db.query_raw(SCAN_COUNTS_SQL.format(ids=placeholders), *ids)}
+    review_stats = {row["qrCodeId"]: row for row in await db.query_raw(REVIEW_STATS_SQL.format(ids=placeholders), *ids)}
+
+    result = []
+    for qr in qr_codes:
+        counts = scan_counts.get(qr.id, {})
+        stats = review_stats.get(qr.id, {})
+        scans = int(counts.get("scans") or 0)
+        submissions = int(counts.get("submissions") or 0)
+        avg_rating = float(stats.get("averageRating") or 0)
+
+        conversion_rate = f"{(submissions / scans * 100):.1f}%" if scans > 0 else "0%"
+
+        result.append({
+            "id": qr.id,
+            "businessName": qr.businessName,
+            "productSummary": qr.productSummary,
+            "createdAt": qr.createdAt,
+            "visitUrl": f"http://localhost:3000/visit/{qr.id}",
+            "analytics": {
+                "totalScans": scans,
+                "totalReviews": int(stats.get("reviews") or 0),
+                "totalSubmissions": submissions,
+                "averageRating": round(avg_rating, 1),
+                "conversionRate": conversion_rate
+            }
+        })
+    return result
+
+async def fetch_qr_code_page(where: Dict[str, Any], page_rows: int):
+    """
+    Returns (rows, next cursor) for up to page_rows QR codes, newest first.
+    The cursor is None after the last page.
+    """
+    qr_codes = await db.qrcode.find_many(
+        where=where,
+        order=[{"createdAt": "desc"}, {"id": "desc"}],
+        take=page_rows,
+    )
+    cursor = encode_list_cursor(qr_codes[-1]) if len(qr_codes) == page_rows else None
+    return await list_qr_code_rows(qr_codes), cursor
+
+async def iter_qr_code_pages(where: Dict[str, Any]):
+    while True:
+        rows, cursor = await fetch_qr_code_page(where, LIST_PAGE_ROWS)
+        yield rows
+        if cursor is None:
+            return
+        where = decode_list_cursor(cursor)
+
 @router.get("/qr-codes/list")
-async def list_qr_codes():
+async def list_qr_codes(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(default=None, ge=1, le=LIST_PAGE_ROWS),
+    format: str = "json",
+):
+    """
+    With limit, returns one page and a nextCursor to pass back as cursor.
+    format=ndjson streams one QR code per line from cursor to the end,
+    reading LIST_PAGE_ROWS at a time. Without either, returns the whole
+    list in one response.
+    """
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    where = decode_list_cursor(cursor) if cursor else {}
+
+    if format == "ndjson":
+        async def lines():
+            try:
+                async for rows in iter_qr_code_pages(where):
+                    yield "".join(json.dumps(row, default=datetime.datetime.isoformat) + "\n" for row in rows)
+            except Exception as e:
+                # Headers are already sent; a truncated body is all we can signal
+                print(f"Error streaming QR codes: {e}")
+                raise
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
     try:
-        qr_codes = await db.qrcode.find_many(
-            include={
-                "reviews": True, # Optimized query would use _count but prisma python might access differently or manually count
-                "scanLogs": True
-            },
-            order={"createdAt": "desc"}
-        )
-        
+        if limit is not None:
+            rows, next_cursor = await fetch_qr_code_page(where, limit)
+            return {"success": True, "qrCodes": rows, "nextCursor": next_cursor}
+
         result = []
-        for qr in qr_codes:
-            scans = len([log for log in qr.scanLogs if log.action == 'scan'])
-            submissions = len([log for log in qr.scanLogs if log.action == 'review_submitted'])
-            
-            ratings = [r.rating for r in qr.reviews]
-            avg_rating = sum(ratings) / len(ratings) if ratings else 0
-            
-            conversion_rate = f"{(submissions / scans * 100):.1f}%" if scans > 0 else "0%"
-            
-            result.append({
-                "id": qr.id,
-                "businessName": qr.businessName,
-                "productSummary": qr.productSummary,
-                "createdAt": qr.createdAt,
-                "visitUrl": f"http://localhost:3000/visit/{qr.id}",
-                "analytics": {
-                    "totalScans": scans,
-                    "totalReviews": len(qr.reviews), # Using len of included list for now
-                    "totalSubmissions": submissions,
-                    "averageRating": round(avg_rating, 1),
-                    "conversionRate": conversion_rate
-                }
-            })
-            
+        async for rows in iter_qr_code_pages(where):
+            result.extend(rows)
         return {"success": True, "qrCodes": result}
 
     except Exception as e:
         print(f"Error listing QR codes: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch QR codes")
+
+class QRSelection(BaseModel):
+    ids: Optional[List[str]] = None  # Explicit QR ids, otherwise the filters below apply
+    businessType: Optional[str] = None
+    location: Optional[str] = None
+
+class ExportQRRequest(QRSelection):
+    format: str = "png"
+    boxSize: int = Field(default=10, ge=1, le=100)
+
+class PrintSheetRequest(QRSelection):
+    columns: int = Field(default=3, ge=1, le=10)
+    rows: int = Field(default=4, ge=1, le=10)
+    dpi: int = Field(default=300, ge=300, le=600)
+    page: str = "A4"
+    frame: Optional[str] = None  # Frame id from frames/manifest.json, e.g. "frame-55"
+
+async def find_selected_qr_codes(body: QRSelection):
+    where: Dict[str, Any] = {}
+    if body.ids is not None:
+        # An empty selection selects nothing, only an omitted ids means all
+        if not body.ids:
+            raise HTTPException(status_code=400, detail="ids must not be empty")
+        where["id"] = {"in": body.ids}
+    if body.businessType:
+        where["businessType"] = body.businessType
+    if body.location:
+        where["location"] = body.location
+
+    try:
+        qr_codes = await db.qrcode.find_many(where=where, order={"createdAt": "desc"})
+    except Exception as e:
+        print(f"Error loading selected QR codes: {e}")
+        raise HTTPException(status_code=500, detail="Failed to load QR codes")
+
+    if not qr_codes:
+        raise HTTPException(status_code=404, detail="No QR codes matched")
+    return qr_codes
+
+@router.post("/qr-codes/export")
+async def export_qr_codes(body: ExportQRRequest):
+    if body.format not in ("png", "svg"):
+        raise HTTPException(status_code=400, detail="format must be png or svg")
+
+    qr_codes = await find_selected_qr_codes(body)
+
+    return StreamingResponse(
+        stream_qr_zip(qr_codes, format=body.format, box_size=body.boxSize),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="qr-codes.zip"'},
+    )
+
+@router.post("/qr-codes/print-sheet")
+async def print_sheet(body: PrintSheetRequest):
+    if body.page not in PAGE_SIZES:
+        raise HTTPException(status_code=400, detail=f"page must be one of {', '.join(PAGE_SIZES)}")
+
+    qr_codes = await find_selected_qr_codes(body)
+
+    try:
+        # Rasterizes the frame and checks the tile size up front, so setup
+        # errors surface before streaming starts
+        layout = await run_in_threadpool(
+            PrintLayout, columns=body.columns, rows=body.rows, dpi=body.dpi, page=body.page, frame_id=body.frame,
+            longest_data=max((tile_data(qr_code) for qr_code in qr_codes), key=len),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        print(f"Error preparing print sheet: {e}")
+        raise HTTPException(status_code=503, detail="Framed print sheets are not available on this server")
+
+    # A sync generator, so Starlette renders the tiles in its threadpool
+    return StreamingResponse(
+        iter_print_sheet_pdf(qr_codes, layout),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="qr-print-sheet.pdf"'},
+    )
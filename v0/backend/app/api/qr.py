@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Response
+from fastapi import APIRouter, HTTPException, Response, Header, Query
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from app.db import db
 from app.services.gemini import generate_review, generate_hash, calculate_similarity, GeneratedReview
-from app.services.qrcode_generator import generate_qr_code_image
+from app.services.qrcode_generator import generate_qr_code_image, generate_qr_code_svg
+from app.services.image_cache import image_cache, qr_image_key
+from app.services.qr_cache import qr_record_cache
+from app.services.scan_log import scan_log_buffer
+from app.services.job_scheduler import review_scheduler, QueueFull
+from app.services.draft_pool import claim_draft
+from app.services.frames import load_frames_manifest, get_frame, generate_framed_qr_png
+from app.services import tracing, job_events
+from app.services.tracing import span
 from nanoid import generate as nanoid
 from datetime import datetime
+from typing import Optional
 import datetime as dt
 
 router = APIRouter()
@@ -14,24 +24,114 @@ class ScanRequest(BaseModel):
     deviceId: str
     sessionId: str
 
+IMAGE_CACHE_CONTROL = "public, max-age=86400"
+# Framed image widths are rounded up to a multiple of this
+FRAME_WIDTH_STEP = 64
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
 @router.get("/image/{qr_id}")
-async def get_qr_image(qr_id: str):
+async def get_qr_image(qr_id: str, format: str = "png", if_none_match: Optional[str] = Header(default=None)):
+    # /image/{qr_id}.svg is shorthand for ?format=svg
+    if qr_id.endswith(".svg"):
+        qr_id, format = qr_id[:-4], "svg"
+    if format not in ("png", "svg"):
+        raise HTTPException(status_code=400, detail="format must be png or svg")
+
     # Fetch QR to ensure it exists and get visit URL
-    qr_code = await db.qrcode.find_unique(where={"id": qr_id})
+    qr_code = await qr_record_cache.get(qr_id)
     if not qr_code:
          raise HTTPException(status_code=404, detail="QR code not found")
          
     # Should be the visit URL
     visit_url = f"http://localhost:3000/visit/{qr_code.id}"
+
+    render_params = {
+        "data": visit_url,
+        "fill_color": "black",
+        "back_color": "white",
+        "border": 4,
+        "error_correction": "L",
+    }
+    if format == "svg":
+        key = qr_image_key("svg", render_params)
+        render, media_type = generate_qr_code_svg, "image/svg+xml"
+    else:
+        render_params["box_size"] = 10
+        key = qr_image_key("png", render_params)
+        render, media_type = generate_qr_code_image, "image/png"
+
+    return await cached_image_response(key, media_type, if_none_match, render, **render_params)
+
+@router.get("/frames")
+async def list_frames():
+    try:
+        frames = load_frames_manifest()
+    except OSError as e:
+        print(f"Error loading frames manifest: {e}")
+        raise HTTPException(status_code=500, detail="Frames manifest not available")
+    return {"frames": list(frames.values())}
+
+@router.get("/image/{qr_id}/framed")
+async def get_framed_qr_image(qr_id: str, frame: str, size: int = Query(default=1024, ge=128, le=4096), if_none_match: Optional[str] = Header(default=None)):
+    frame_info = get_frame(frame)
+    if not frame_info:
+        raise HTTPException(status_code=404, detail="Frame not found")
+
+    qr_code = await qr_record_cache.get(qr_id)
+    if not qr_code:
+         raise HTTPException(status_code=404, detail="QR code not found")
+
+    render_params = {
+        "data": f"http://localhost:3000/visit/{qr_code.id}",
+        "frame_id": frame_info["id"],
+        # Snapped so that arbitrary sizes can't fill the frame raster cache
+        "width": -(-size // FRAME_WIDTH_STEP) * FRAME_WIDTH_STEP,
+        "error_correction": "L",
+    }
+    # Placement is part of the key, so regenerating the manifest invalidates old composites
+    key = qr_image_key("framed", dict(render_params, qrArea=frame_info["qrArea"], file=frame_info["file"]))
+
+    try:
+        return await cached_image_response(key, "image/png", if_none_match, generate_framed_qr_png, **render_params)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except RuntimeError as e:
+        print(f"Error compositing framed QR: {e}")
+        raise HTTPException(status_code=503, detail="Framed QR images are not available on this server")
+
+async def cached_image_response(key: str, media_type: str, if_none_match: Optional[str], render, **render_params) -> Response:
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+
+    # The key covers every render input, so a matching tag means the client copy is current
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    img_bytes = image_cache.get(key)
+    if img_bytes is None:
+        # Generate image off the event loop
+        img_bytes = await run_in_threadpool(render, **render_params)
+        image_cache.put(key, img_bytes)
     
-    # Generate image
-    img_bytes = generate_qr_code_image(visit_url)
-    
-    return Response(content=img_bytes, media_type="image/png")
+    return Response(content=img_bytes, media_type=media_type, headers=headers)
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = await review_scheduler.status(job_id)
+    if not job:
+        # Scans served from the draft pool have a review but no job row
+        if await db.tempreview.find_first(where={"jobId": job_id, "expiresAt": {"gt": datetime.now()}}):
+            return {"jobId": job_id, "state": "done", "attempts": 0, "error": None}
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @router.post("/scan")
-async def scan_qr(request: ScanRequest, background_tasks: BackgroundTasks):
-    print(f"DEBUG: scan_qr called for {request.qrId}")
+async def scan_qr(request: ScanRequest):
     qr_id = request.qrId
     device_id = request.deviceId
     session_id = request.sessionId
@@ -40,28 +140,39 @@ async def scan_qr(request: ScanRequest, background_tasks: BackgroundTasks):
         raise HTTPException(status_code=400, detail="qrId is required")
 
     # Fetch QR code
-    print("DEBUG: fetching QR from DB")
-    qr_code = await db.qrcode.find_unique(where={"id": qr_id})
+    qr_code = await qr_record_cache.get(qr_id)
     if not qr_code:
-        print("DEBUG: QR not found")
         raise HTTPException(status_code=404, detail="QR code not found")
-    print(f"DEBUG: stored QR found: {qr_code.id}")
 
     # Log scan
-    print("DEBUG: creating scan log")
-    await db.scanlog.create(data={
+    scan_log_buffer.add({
         "qrCodeId": qr_id,
         "deviceType": device_id,
         "action": "scan",
         "timestamp": datetime.now(),
     })
-    print("DEBUG: scan log created")
 
     job_id = nanoid()
+    tracing.bind_job(job_id)
 
-    # Generate review in background
-    print("DEBUG: adding background task")
-    background_tasks.add_task(process_review_generation, qr_code, job_id, session_id)
+    # A pre-generated draft makes the review available right away
+    if await claim_draft(qr_code.id, job_id, session_id):
+        return {
+            "status": "accepted",
+            "jobId": job_id,
+            "googleMapsLink": qr_code.googleMapsLink,
+        }
+
+    # Generate review on the review worker pool
+    try:
+        await review_scheduler.submit(job_id, qr_code.id, session_id)
+    except QueueFull as e:
+        print(f"Rejecting review job: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many reviews are being generated, please try again shortly",
+            headers={"Retry-After": "5"},
+        )
 
     return {
         "status": "accepted",
@@ -69,7 +180,37 @@ async def scan_qr(request: ScanRequest, background_tasks: BackgroundTasks):
         "googleMapsLink": qr_code.googleMapsLink,
     }
 
-async def process_review_generation(qr_code, job_id, session_id):
+async def run_review_job(job: dict):
+    qr_code = await qr_record_cache.get(job["qrCodeId"])
+    if not qr_code:
+        raise RuntimeError(f"QR code {job['qrCodeId']} no longer exists")
+
+    # A previous attempt may have stored the review before its worker died
+    with span("db.tempreview.find_unique"):
+        existing = await db.tempreview.find_unique(where={"jobId": job["id"]})
+    if existing:
+        return
+
+    try:
+        await process_review_generation(
+            qr_code, job["id"], job["sessionId"],
+            on_text=lambda text: job_events.publish_text(job["id"], text),
+        )
+    except Exception:
+        if job["attempts"] >= job["maxAttempts"]:
+            job_events.publish_failed(job["id"])
+        raise
+    finally:
+        job_events.close(job["id"])
+
+async def generate_pooled_draft(qr_code_id: str, job_id: str, language: str, expires_in: dt.timedelta):
+    qr_code = await qr_record_cache.get(qr_code_id)
+    if not qr_code:
+        raise RuntimeError(f"QR code {qr_code_id} no longer exists")
+    with tracing.trace(job_id), span("draft_pool.generate", language=language):
+        await process_review_generation(qr_code, job_id, None, language=language, expires_in=expires_in)
+
+async def process_review_generation(qr_code, job_id, session_id, language=None, expires_in=dt.timedelta(minutes=30), on_text=None):
     max_attempts = 3
     attempt = 0
     review = None
@@ -80,25 +221,29 @@ async def process_review_generation(qr_code, job_id, session_id):
         try:
             generated: GeneratedReview = await generate_review(
                 business_name=qr_code.businessName,
-                product_summary=qr_code.productSummary or qr_code.businessName
+                product_summary=qr_code.productSummary or qr_code.businessName,
+                language=language,
+                on_text=on_text
             )
             
             review_hash = generate_hash(generated.reviewText)
 
             # Check for exact duplicates
-            existing = await db.tempreview.find_first(where={"hash": review_hash})
+            with span("db.tempreview.find_first"):
+                existing = await db.tempreview.find_first(where={"hash": review_hash})
             if existing:
                 print(f"Duplicate review detected (attempt {attempt}), regenerating...")
                 continue
             
             # Check for similar reviews (last 90 days)
             cutoff = datetime.now() - dt.timedelta(days=90)
-            recent_reviews = await db.tempreview.find_many(
-                where={
-                    "qrCodeId": qr_code.id,
-                    "createdAt": {"gte": cutoff}
-                }
-            )
+            with span("db.tempreview.find_many"):
+                recent_reviews = await db.tempreview.find_many(
+                    where={
+                        "qrCodeId": qr_code.id,
+                        "createdAt": {"gte": cutoff}
+                    }
+                )
             
             is_similar = False
             for r in recent_reviews:
@@ -111,20 +256,22 @@ async def process_review_generation(qr_code, job_id, session_id):
                 continue
                 
             # Store temp review
-            expires_at = datetime.now() + dt.timedelta(minutes=30)
-            review = await db.tempreview.create(data={
-                "jobId": job_id,
-                "qrCodeId": qr_code.id,
-                "reviewText": generated.reviewText,
-                "language": generated.language,
-                "rating": generated.rating,
-                "hash": review_hash,
-                "sessionId": session_id,
-                "expiresAt": expires_at
-            })
+            expires_at = datetime.now() + expires_in
+            with span("db.tempreview.create"):
+                review = await db.tempreview.create(data={
+                    "jobId": job_id,
+                    "qrCodeId": qr_code.id,
+                    "reviewText": generated.reviewText,
+                    "language": generated.language,
+                    "rating": generated.rating,
+                    "hash": review_hash,
+                    "sessionId": session_id,
+                    "expiresAt": expires_at
+                })
+            job_events.publish_ready(job_id, review)
             
             # Log generation
-            await db.scanlog.create(data={
+            scan_log_buffer.add({
                 "qrCodeId": qr_code.id,
                 "jobId": job_id,
                 "action": "review_generated",
@@ -134,3 +281,6 @@ async def process_review_generation(qr_code, job_id, session_id):
         except Exception as e:
             print(f"Error in review generation task: {e}")
             break
+
+    if not review:
+        raise RuntimeError(f"No review generated after {attempt} attempts")
@@ -1,13 +1,35 @@
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from app.db import db
+from app.db import db, epoch_ms
+from app.services.scan_log import scan_log_buffer
+from app.services.job_scheduler import review_scheduler, FAILED
+from app.services import tracing, job_events, metrics
+from app.services.tracing import span
+import os
 import json
 import asyncio
 from datetime import datetime
+from nanoid import generate as nanoid
 
 router = APIRouter()
 
+# Completion normally arrives as a job event, from this or another worker;
+# the database is still checked this often in case an event was lost
+SAFETY_POLL_SECONDS = float(os.environ.get("SSE_SAFETY_POLL_SECONDS", "5"))
+MAX_BATCH_JOBS = 100
+
+# Copies a TempReview into Review. Review.jobId is unique, so a second submit
+# of the same job (a double tap) inserts nothing
+SUBMIT_SQL = """
+INSERT INTO "Review" ("id", "jobId", "qrCodeId", "reviewText", "language", "rating", "source", "createdAt")
+SELECT ?, "jobId", "qrCodeId", ?, "language", "rating", 'auto-gemini', ?
+FROM "TempReview" WHERE "jobId" = ? AND "expiresAt" > ?
+ON CONFLICT ("jobId") DO NOTHING
+"""
+
+DELETE_TEMP_SQL = 'DELETE FROM "TempReview" WHERE "jobId" = ?'
+
 class SubmitRequest(BaseModel):
     jobId: str
     reviewText: str
@@ -16,41 +38,155 @@ class SubmitRequest(BaseModel):
 async def stream_review(jobId: str, request: Request):
     if not jobId:
         raise HTTPException(status_code=400, detail="jobId is required")
+    tracing.bind_job(jobId)
 
     async def event_generator():
         # Initial connection
         yield f": connected\n\n"
-        
-        timeout = 30 # seconds
-        start_time = datetime.now()
-        
-        while True:
-            # Check for timeout
-            if (datetime.now() - start_time).seconds > timeout:
-                yield f"data: {json.dumps({'type': 'timeout'})}\n\n"
-                break
-                
-            # Check for disconnect
-            if await request.is_disconnected():
-                break
+
+        # Progress and completion of the job, if it runs in this process
+        updates = job_events.subscribe(jobId)
+        loop = asyncio.get_running_loop()
+
+        # Time from stream open until the review (or timeout) is sent
+        with span("sse.wait", polls=0, deltas=0) as wait:
+            timeout = 30 # seconds without any progress
+            last_progress = loop.time()
+            next_poll = loop.time()
 
             try:
-                review = await db.tempreview.find_unique(where={"jobId": jobId})
-                
-                if review:
-                    data = json.dumps({
-                        "type": "review_ready",
-                        "jobId": review.jobId,
-                        "reviewText": review.reviewText,
-                        "language": review.language,
-                        "rating": review.rating,
-                    })
-                    yield f"data: {data}\n\n"
+                while True:
+                    # Check for timeout
+                    if loop.time() - last_progress > timeout:
+                        wait["outcome"] = "timeout"
+                        yield f"data: {json.dumps({'type': 'timeout'})}\n\n"
+                        break
+
+                    # Check for disconnect
+                    if await request.is_disconnected():
+                        wait["outcome"] = "disconnected"
+                        break
+
+                    if loop.time() >= next_poll:
+                        next_poll = loop.time() + SAFETY_POLL_SECONDS
+                        try:
+                            wait["polls"] += 1
+                            review = await db.tempreview.find_first(where={"jobId": jobId, "expiresAt": {"gt": datetime.now()}})
+
+                            if review:
+                                data = json.dumps({
+                                    "type": "review_ready",
+                                    "jobId": review.jobId,
+                                    "reviewText": review.reviewText,
+                                    "language": review.language,
+                                    "rating": review.rating,
+                                })
+                                wait["outcome"] = "review_ready"
+                                yield f"data: {data}\n\n"
+                                break
+
+                            job = await review_scheduler.status(jobId)
+                            if job and job["state"] == FAILED:
+                                wait["outcome"] = "failed"
+                                yield f"data: {json.dumps({'type': 'error', 'jobId': jobId})}\n\n"
+                                break
+                        except Exception as e:
+                            print(f"Error polling: {e}")
+
+                    # Forward job events until the next poll is due
+                    try:
+                        event = await asyncio.wait_for(updates.get(), max(0, next_poll - loop.time()))
+                    except asyncio.TimeoutError:
+                        continue
+                    last_progress = loop.time()
+                    yield f"data: {json.dumps(event)}\n\n"
+                    if event["type"] == "review_delta":
+                        wait["deltas"] += 1
+                        continue
+                    wait["outcome"] = "review_ready" if event["type"] == "review_ready" else "failed"
                     break
-            except Exception as e:
-                print(f"Error polling: {e}")
-                
-            await asyncio.sleep(1)
+            finally:
+                job_events.unsubscribe(jobId, updates)
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+@router.get("/stream/batch")
+async def stream_reviews(jobIds: str, request: Request):
+    """
+    One stream for many jobs (comma-separated jobIds). Sends review_ready or
+    error for each job as it finishes, without partial text, and closes once
+    every job has finished.
+    """
+    job_ids = list(dict.fromkeys(job_id for job_id in jobIds.split(",") if job_id))
+    if not job_ids:
+        raise HTTPException(status_code=400, detail="jobIds is required")
+    if len(job_ids) > MAX_BATCH_JOBS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_JOBS} jobIds per stream")
+
+    async def event_generator():
+        yield ": connected\n\n"
+
+        # All jobs' events arrive on one queue
+        updates = asyncio.Queue()
+        for job_id in job_ids:
+            job_events.subscribe(job_id, updates)
+        pending = set(job_ids)
+        loop = asyncio.get_running_loop()
+
+        with span("sse.batch_wait", jobs=len(job_ids), polls=0) as wait:
+            timeout = 30 # seconds without any job finishing
+            last_progress = loop.time()
+            next_poll = loop.time()
+
+            try:
+                while pending:
+                    if loop.time() - last_progress > timeout:
+                        wait["outcome"] = "timeout"
+                        yield f"data: {json.dumps({'type': 'timeout', 'jobIds': sorted(pending)})}\n\n"
+                        break
+
+                    if await request.is_disconnected():
+                        wait["outcome"] = "disconnected"
+                        break
+
+                    finished = []
+                    if loop.time() >= next_poll:
+                        next_poll = loop.time() + SAFETY_POLL_SECONDS
+                        try:
+                            wait["polls"] += 1
+                            # One IN query for every job still pending
+                            reviews = await db.tempreview.find_many(where={"jobId": {"in": list(pending)}, "expiresAt": {"gt": datetime.now()}})
+                            finished += [{
+                                "type": "review_ready",
+                                "jobId": review.jobId,
+                                "reviewText": review.reviewText,
+                                "language": review.language,
+                                "rating": review.rating,
+                            } for review in reviews]
+                            failed = await review_scheduler.failed(list(pending - {review.jobId for review in reviews}))
+                            finished += [{"type": "error", "jobId": job_id} for job_id in failed]
+                        except Exception as e:
+                            print(f"Error polling: {e}")
+                    else:
+                        try:
+                            event = await asyncio.wait_for(updates.get(), max(0, next_poll - loop.time()))
+                        except asyncio.TimeoutError:
+                            continue
+                        if event["type"] != "review_delta":
+                            finished.append(event)
+
+                    for event in finished:
+                        if event["jobId"] in pending:
+                            pending.discard(event["jobId"])
+                            last_progress = loop.time()
+                            yield f"data: {json.dumps(event)}\n\n"
+
+                if not pending:
+                    wait["outcome"] = "done"
+                    yield f"data: {json.dumps({'type': 'done'})}\n\n"
+            finally:
+                for job_id in job_ids:
+                    job_events.unsubscribe(job_id, updates)
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -61,29 +197,38 @@ async def submit_review(body: SubmitRequest):
     
     if not job_id or not review_text:
         raise HTTPException(status_code=400, detail="jobId and reviewText are required")
+    tracing.bind_job(job_id)
 
-    temp_review = await db.tempreview.find_unique(where={"jobId": job_id})
-    if not temp_review:
+    review, created = await move_temp_review(job_id, review_text)
+    if not review:
         raise HTTPException(status_code=404, detail="Review not found or expired")
 
-    # Create permanent review
-    review = await db.review.create(data={
-        "qrCodeId": temp_review.qrCodeId,
-        "reviewText": review_text,
-        "language": temp_review.language,
-        "rating": temp_review.rating,
-        "source": "auto-gemini",
-    })
-
-    # Delete temp review
-    await db.tempreview.delete(where={"jobId": job_id})
-
-    # Log submission
-    await db.scanlog.create(data={
-        "qrCodeId": temp_review.qrCodeId,
-        "jobId": job_id,
-        "action": "review_submitted",
-        "timestamp": datetime.now()
-    })
+    # Log submission, once per review
+    if created:
+        scan_log_buffer.add({
+            "qrCodeId": review.qrCodeId,
+            "jobId": job_id,
+            "action": "review_submitted",
+            "timestamp": datetime.now()
+        })
+    else:
+        metrics.incr("reviews.duplicate_submit")
 
     return {"success": True, "reviewId": review.id}
+
+async def move_temp_review(job_id: str, review_text: str):
+    """
+    Turns the job's TempReview into a Review in one transaction, and returns
+    (review, created). A job that was already submitted returns its
+    existing Review with created=False; (None, False) means no such job.
+    """
+    review_id = nanoid()
+    with span("db.review.submit_batch"):
+        async with db.batch_() as batcher:
+            now = epoch_ms(datetime.now())
+            batcher.execute_raw(SUBMIT_SQL, review_id, review_text, now, job_id, now)
+            batcher.execute_raw(DELETE_TEMP_SQL, job_id)
+
+    with span("db.review.find_unique"):
+        review = await db.review.find_unique(where={"jobId": job_id})
+    return review, review is not None and review.id == review_id
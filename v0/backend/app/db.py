@@ -1,3 +1,14 @@
+import datetime as dt
 from prisma import Prisma
 
 db = Prisma()
+
+def epoch_ms(value: dt.datetime) -> int:
+    """
+    A DateTime as raw SQL compares it: Prisma stores SQLite DateTime columns
+    as epoch milliseconds and sends naive datetimes (the datetime.now()
+    values used throughout) as UTC.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt.timezone.utc)
+    return int(value.timestamp() * 1000)
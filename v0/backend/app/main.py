@@ -3,6 +3,14 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.api import qr, reviews, admin, conversion
 from app.db import db
+from app.services.qr_export import shutdown_render_pool
+from app.services.scan_log import scan_log_buffer
+from app.services.job_scheduler import review_scheduler
+from app.services.draft_pool import draft_refiller
+from app.services.temp_review_sweeper import temp_review_sweeper
+from app.services import tracing, job_events
+from app.services.event_hub import event_hub
+from app.services.tracing import TracingMiddleware
 import os
 from dotenv import load_dotenv
 
@@ -10,14 +18,32 @@ load_dotenv()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    tracing.start()
     # Connect to database on startup
     await db.connect()
+    scan_log_buffer.start()
+    # Job events from the other worker processes
+    event_hub.start(job_events.receive)
+    # Also resumes jobs left unfinished by the previous run
+    review_scheduler.start(qr.run_review_job)
+    draft_refiller.start(qr.generate_pooled_draft)
+    temp_review_sweeper.start()
     yield
+    await temp_review_sweeper.stop()
+    await draft_refiller.stop()
+    await review_scheduler.stop()
+    await event_hub.stop()
+    # Write buffered scan logs before disconnecting
+    await scan_log_buffer.stop()
     # Disconnect from database on shutdown
     await db.disconnect()
+    shutdown_render_pool()
+    tracing.stop()
 
 app = FastAPI(title="QR Generator Backend", lifespan=lifespan)
 
+app.add_middleware(TracingMiddleware)
+
 # Allow CORS for local development
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,5 @@
+import os
+
+# Local state kept next to the code: the QR image cache, trace files, rate
+# limit counters, and the socket and lock files shared by worker processes
+CACHE_ROOT = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".cache")
@@ -0,0 +1,165 @@
+import os
+import math
+import time
+import asyncio
+import datetime as dt
+from collections import Counter
+from typing import Awaitable, Callable, Optional
+from nanoid import generate as nanoid
+from app.db import db, epoch_ms
+from app.paths import CACHE_ROOT
+from app.services import metrics
+from app.services.gemini import LANGUAGES
+from app.services.tracing import span
+from app.services.worker_lock import WorkerLock
+
+# Pre-generated review drafts per QR code. Pooled drafts are ordinary
+# TempReview rows whose jobId starts with POOL_PREFIX; scan_qr claims one by
+# rewriting its jobId to the new job's id, so stream_review finds it on its
+# first poll. A background refiller keeps each QR's pool at a depth that
+# follows its recent scan rate, with languages spread evenly. Only the
+# worker holding an flock on LOCK_PATH refills, so running several uvicorn
+# workers does not multiply the drafts generated; if it exits, another
+# worker takes over on its next cycle.
+
+ENABLED = os.environ.get("DRAFT_POOL", "1") == "1"
+POOL_PREFIX = "pool-"
+MAX_DEPTH = int(os.environ.get("DRAFT_POOL_MAX_DEPTH", "5"))
+# Drafts to keep ready per QR: the scans expected in this many minutes
+LEAD_MINUTES = float(os.environ.get("DRAFT_POOL_LEAD_MINUTES", "10"))
+# Scan rate window; QR codes without scans in it get no pool
+WINDOW_MINUTES = float(os.environ.get("DRAFT_POOL_WINDOW_MINUTES", "60"))
+REFILL_SECONDS = float(os.environ.get("DRAFT_POOL_REFILL_SECONDS", "30"))
+REFILL_CONCURRENCY = int(os.environ.get("DRAFT_POOL_REFILL_CONCURRENCY", "2"))
+LOCK_PATH = os.environ.get(
+    "DRAFT_POOL_LOCK",
+    os.path.join(CACHE_ROOT, "draft-refiller.lock"),
+)
+DRAFT_TTL = dt.timedelta(hours=float(os.environ.get("DRAFT_POOL_TTL_HOURS", "24")))
+# Lifetime of a claimed draft, the same as an on-demand one
+CLAIMED_TTL = dt.timedelta(minutes=30)
+
+CLAIM_SQL = """
+UPDATE "TempReview"
+SET "jobId" = ?, "sessionId" = ?, "expiresAt" = ?
+WHERE "id" = (
+    SELECT "id" FROM "TempReview"
+    WHERE "qrCodeId" = ? AND "jobId" LIKE 'pool-%' AND "expiresAt" > ?
+    ORDER BY "createdAt"
+    LIMIT 1
+)
+RETURNING "id"
+"""
+
+SCAN_RATES_SQL = """
+SELECT "qrCodeId", COUNT(*) AS "scans" FROM "ScanLog"
+WHERE "action" = 'scan' AND "timestamp" >= ?
+GROUP BY "qrCodeId"
+"""
+
+POOLED_LANGUAGES_SQL = """
+SELECT "qrCodeId", "language", COUNT(*) AS "drafts" FROM "TempReview"
+WHERE "jobId" LIKE 'pool-%' AND "expiresAt" > ?
+GROUP BY "qrCodeId", "language"
+"""
+
+def target_depth(scans: int) -> int:
+    if scans <= 0:
+        return 0
+    return min(MAX_DEPTH, max(1, math.ceil(scans / WINDOW_MINUTES * LEAD_MINUTES)))
+
+async def claim_draft(qr_code_id: str, job_id: str, session_id: Optional[str]) -> bool:
+    """
+    Hands one pooled draft for the QR code to job_id. Returns False when the
+    pool is empty. A single UPDATE, so two scans never get the same draft.
+    """
+    if not ENABLED:
+        return False
+
+    now = dt.datetime.now()
+    try:
+        with span("db.tempreview.claim_draft"):
+            claimed = await db.query_raw(CLAIM_SQL, job_id, session_id, epoch_ms(now + CLAIMED_TTL), qr_code_id, epoch_ms(now))
+    except Exception as e:
+        print(f"Error claiming pooled draft: {e}")
+        claimed = []
+
+    metrics.incr("draft_pool.hit" if claimed else "draft_pool.miss")
+    return bool(claimed)
+
+class DraftRefiller:
+    def __init__(self, concurrency: int, lock_path: str):
+        self.concurrency = concurrency
+        self._lock = WorkerLock(lock_path)
+        self._task: Optional[asyncio.Task] = None
+        self._generate: Optional[Callable[..., Awaitable]] = None
+
+    def start(self, generate: Callable[..., Awaitable]) -> None:
+        """
+        generate(qr_code_id, job_id, language, expires_in) stores one TempReview.
+        """
+        if not ENABLED:
+            return
+        self._generate = generate
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._lock.release()
+
+    async def _run(self) -> None:
+        while True:
+            if self._elected():
+                try:
+                    await self.refill()
+                except Exception as e:
+                    print(f"Error refilling draft pool: {e}")
+            await asyncio.sleep(REFILL_SECONDS)
+
+    def _elected(self) -> bool:
+        if self._lock.held:
+            return True
+        if not self._lock.acquire():
+            return False
+        print(f"Refilling the draft pool from this worker (pid {os.getpid()})")
+        return True
+
+    async def refill(self) -> None:
+        now = dt.datetime.now()
+        scans = await db.query_raw(SCAN_RATES_SQL, epoch_ms(now - dt.timedelta(minutes=WINDOW_MINUTES)))
+        pooled = {}
+        for row in await db.query_raw(POOLED_LANGUAGES_SQL, epoch_ms(now)):
+            pooled.setdefault(row["qrCodeId"], Counter())[row["language"]] = int(row["drafts"])
+
+        # One draft per entry, in the language the QR's pool has fewest of
+        wanted = []
+        for row in scans:
+            languages = pooled.get(row["qrCodeId"], Counter())
+            for _ in range(target_depth(int(row["scans"])) - sum(languages.values())):
+                language = min(LANGUAGES, key=lambda name: languages[name])
+                languages[language] += 1
+                wanted.append((row["qrCodeId"], language))
+
+        if not wanted:
+            return
+        print(f"Refilling draft pool with {len(wanted)} drafts")
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def generate_one(qr_code_id, language):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await self._generate(qr_code_id, f"{POOL_PREFIX}{nanoid()}", language, DRAFT_TTL)
+                    metrics.incr("draft_pool.refilled")
+                except Exception as e:
+                    print(f"Error generating pooled draft for {qr_code_id}: {e}")
+                    metrics.incr("draft_pool.refill_failed")
+                finally:
+                    metrics.observe("draft_pool.refill_seconds", time.perf_counter() - started)
+
+        await asyncio.gather(*(generate_one(qr_code_id, language) for qr_code_id, language in wanted))
+
+draft_refiller = DraftRefiller(REFILL_CONCURRENCY, LOCK_PATH)
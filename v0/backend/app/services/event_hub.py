@@ -0,0 +1,136 @@
+import os
+import json
+import asyncio
+from typing import Callable, Optional, Set
+from app.paths import CACHE_ROOT
+from app.services import metrics
+from app.services.worker_lock import WorkerLock
+
+# Relays job events between the uvicorn worker processes on one host, so a
+# stream connected to one worker hears about a job generated by another.
+# Whichever worker holds an flock on LOCK_PATH serves a Unix socket hub; every
+# worker (the hub's own included) keeps one connection to it, sends the
+# events it publishes and receives everyone else's as NDJSON lines. If the
+# hub worker exits, the lock is released and another worker takes over.
+
+SOCKET_PATH = os.environ.get(
+    "EVENT_HUB_SOCKET",
+    os.path.join(CACHE_ROOT, "events.sock"),
+)
+LOCK_PATH = SOCKET_PATH + ".lock"
+ENABLED = os.environ.get("EVENT_HUB", "1") == "1"
+RECONNECT_SECONDS = 1.0
+# A worker that stops reading is dropped rather than buffered without bound
+MAX_BUFFER_BYTES = 1024 * 1024
+# Events published while disconnected are dropped past this
+MAX_PENDING = 10000
+
+class EventHub:
+    def __init__(self, socket_path: str, lock_path: str):
+        self.socket_path = socket_path
+        self._lock = WorkerLock(lock_path)
+        self._task: Optional[asyncio.Task] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Set[asyncio.StreamWriter] = set()
+        self._relays: Set[asyncio.Task] = set()
+
+    def start(self, on_event: Callable[[dict], None]) -> None:
+        """
+        on_event is called with every event published by other workers.
+        """
+        if not ENABLED:
+            return
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        self._outbox = asyncio.Queue(MAX_PENDING)
+        self._task = asyncio.create_task(self._run(on_event))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._peers):
+                writer.close()
+            await asyncio.gather(*self._relays, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+        self._lock.release()
+
+    def peers(self) -> int:
+        return len(self._peers)
+
+    def publish(self, event: dict) -> None:
+        if self._outbox is None:
+            return
+        try:
+            self._outbox.put_nowait(event)
+        except asyncio.QueueFull:
+            metrics.incr("event_hub.dropped")
+
+    async def _run(self, on_event: Callable[[dict], None]) -> None:
+        while True:
+            await self._serve_if_elected()
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path)
+            except OSError:
+                await asyncio.sleep(RECONNECT_SECONDS)
+                continue
+
+            sender = asyncio.create_task(self._send(writer))
+            try:
+                while line := await reader.readline():
+                    metrics.incr("event_hub.received")
+                    try:
+                        on_event(json.loads(line))
+                    except Exception as e:
+                        print(f"Error handling hub event: {e}")
+            except OSError:
+                pass
+            finally:
+                sender.cancel()
+                writer.close()
+            print("Lost connection to the event hub, reconnecting")
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    async def _send(self, writer: asyncio.StreamWriter) -> None:
+        while True:
+            event = await self._outbox.get()
+            writer.write(json.dumps(event).encode() + b"\n")
+            await writer.drain()
+
+    async def _serve_if_elected(self) -> None:
+        if self._server is not None or not self._lock.acquire():
+            return
+
+        # Left over from a hub that exited without cleaning up
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._relay, path=self.socket_path)
+        print(f"Serving the event hub on {self.socket_path} (pid {os.getpid()})")
+
+    async def _relay(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._peers.add(writer)
+        self._relays.add(asyncio.current_task())
+        try:
+            while line := await reader.readline():
+                for peer in list(self._peers):
+                    if peer is writer:
+                        continue
+                    if peer.transport.get_write_buffer_size() > MAX_BUFFER_BYTES:
+                        metrics.incr("event_hub.slow_peer_dropped")
+                        self._peers.discard(peer)
+                        peer.close()
+                        continue
+                    peer.write(line)
+        except OSError:
+            pass
+        finally:
+            self._peers.discard(writer)
+            self._relays.discard(asyncio.current_task())
+            writer.close()
+
+event_hub = EventHub(SOCKET_PATH, LOCK_PATH)
+metrics.register_gauge("event_hub.peers", event_hub.peers)
@@ -0,0 +1,68 @@
+import os
+import re
+import json
+import math
+import random
+import asyncio
+from types import SimpleNamespace
+
+# Local stand-in for genai.GenerativeModel, for load tests and offline runs.
+# Enabled with GEMINI_FAKE=1. Latency is log-normal around
+# GEMINI_FAKE_LATENCY_MS (sigma GEMINI_FAKE_LATENCY_SIGMA), and a
+# GEMINI_FAKE_FAILURE_RATE share of calls raise like a quota error. Set
+# GEMINI_FAKE_SEED for a reproducible sequence.
+
+ENABLED = os.environ.get("GEMINI_FAKE", "0") == "1"
+LATENCY_MS = float(os.environ.get("GEMINI_FAKE_LATENCY_MS", "800"))
+LATENCY_SIGMA = float(os.environ.get("GEMINI_FAKE_LATENCY_SIGMA", "0.5"))
+FAILURE_RATE = float(os.environ.get("GEMINI_FAKE_FAILURE_RATE", "0.0"))
+STREAM_CHUNKS = 8
+
+_random = random.Random(os.environ.get("GEMINI_FAKE_SEED"))
+
+# Enough variety that drafts pass the duplicate and similarity checks
+WORDS = (
+    "coffee tea pastry sandwich service staff owner music seating window table price value portion "
+    "fresh warm crispy sweet spicy quick friendly polite clean cozy bright quiet busy lively calm "
+    "morning evening weekend lunch dinner visit return recommend loved enjoyed liked tried ordered "
+    "waited served smiled helped chatted packed delivered family friends colleagues kids parents "
+    "birthday meeting date break snack dessert cake cookie juice shake salad soup pasta pizza bread "
+    "menu counter corner parking location neighbourhood street market station office college"
+).split()
+
+class FakeModel:
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        latency = LATENCY_MS / 1000 * math.exp(_random.gauss(0, LATENCY_SIGMA))
+        fails = _random.random() < FAILURE_RATE
+        text = json.dumps({
+            "review_text": self._review_text(prompt),
+            "language": self._field(prompt, r"Target Language: (\w+)", "english"),
+            "rating": int(self._field(prompt, r"Target Rating: (\d)", "5")),
+        })
+
+        if not stream:
+            await asyncio.sleep(latency)
+            if fails:
+                raise RuntimeError(f"429 Resource exhausted (fake {self.model_name})")
+            return SimpleNamespace(text=text)
+
+        async def chunks():
+            size = math.ceil(len(text) / STREAM_CHUNKS)
+            for start in range(0, len(text), size):
+                await asyncio.sleep(latency / STREAM_CHUNKS)
+                if fails and start >= len(text) // 2:
+                    raise RuntimeError(f"Stream interrupted (fake {self.model_name})")
+                yield SimpleNamespace(text=text[start:start + size])
+        return chunks()
+
+    def _field(self, prompt: str, pattern: str, default: str) -> str:
+        match = re.search(pattern, prompt)
+        return match.group(1) if match else default
+
+    def _review_text(self, prompt: str) -> str:
+        business = self._field(prompt, r"Business Name: (.+)", "this place").strip()
+        words = _random.sample(WORDS, _random.randint(10, 25))
+        return f"{business}: " + " ".join(words).capitalize() + "."
@@ -0,0 +1,133 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from io import BytesIO
+from typing import Optional
+from PIL import Image
+from app.services.qrcode_generator import build_qr, render_matrix_image
+
+# SVG frames and their QR placement manifest, written by
+# `python generate_frames_components.py --manifest` in the v0 directory
+FRAMES_DIR = os.environ.get(
+    "QR_FRAMES_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), "frames"),
+)
+
+# Same inset the React SVGFrame applies around the QR inside its slot
+QR_AREA_PADDING = 0.04
+
+# Rasterized frames are large (width * height * 4 bytes), so the cache is
+# bounded by their total size rather than by entry count
+RASTER_CACHE_BYTES = int(float(os.environ.get("QR_FRAME_RASTER_MB", "256")) * 1024 * 1024)
+
+@lru_cache(maxsize=1)
+def load_frames_manifest() -> dict:
+    with open(os.path.join(FRAMES_DIR, "manifest.json"), encoding="utf-8") as f:
+        return {frame["id"]: frame for frame in json.load(f)["frames"]}
+
+def get_frame(frame_id: str) -> Optional[dict]:
+    # Accept both the frontend id ("frame-55") and the bare file name ("55")
+    frames = load_frames_manifest()
+    return frames.get(frame_id) or frames.get(f"frame-{frame_id}")
+
+def frame_height(frame: dict, width: int) -> int:
+    _, _, vb_w, vb_h = frame["viewBox"]
+    return round(width * vb_h / vb_w)
+
+def rasterize_frame(frame: dict, width: int) -> Image.Image:
+    """
+    Renders the frame SVG to an RGBA image `width` pixels wide.
+    """
+    try:
+        import cairosvg
+    except (ImportError, OSError) as e:  # OSError when the cairo system library is missing
+        raise RuntimeError(f"Framed QR output needs cairosvg: {e}")
+
+    png = cairosvg.svg2png(
+        url=os.path.join(FRAMES_DIR, frame["file"]),
+        output_width=width,
+        output_height=frame_height(frame, width),
+    )
+    return Image.open(BytesIO(png)).convert("RGBA")
+
+class FrameRasterCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._images: "OrderedDict[tuple, Image.Image]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()  # used from the threadpool
+
+    def get(self, frame_id: str, width: int) -> Image.Image:
+        key = (frame_id, width)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+
+        image = rasterize_frame(get_frame(frame_id), width)
+        size = image.width * image.height * 4
+        with self._lock:
+            if key not in self._images and size <= self.max_bytes:
+                self._images[key] = image
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, old = self._images.popitem(last=False)
+                    self._bytes -= old.width * old.height * 4
+        return image
+
+_raster_cache = FrameRasterCache(RASTER_CACHE_BYTES)
+
+def frame_background(frame_id: str, width: int) -> Image.Image:
+    """
+    rasterize_frame() cached per (frame, output width). Callers must not
+    modify the returned image; compose_framed_qr() draws on a copy.
+    """
+    return _raster_cache.get(frame_id, width)
+
+def min_frame_width(frame: dict, modules: int) -> int:
+    """
+    Smallest output width at which a QR of `modules` modules fits the
+    frame's QR slot at one pixel per module.
+    """
+    _, _, vb_w, vb_h = frame["viewBox"]
+    area = frame["qrArea"]
+    slot_fraction = min(area["width"] / 100, area["height"] / 100 * vb_h / vb_w) * (1 - 2 * QR_AREA_PADDING)
+    return int(modules / slot_fraction) + 1
+
+def compose_framed_qr(background: Image.Image, frame: dict, data: str, fill_color="black", back_color="white", error_correction="L") -> Image.Image:
+    """
+    Draws the QR code for `data` into the frame's QR slot on a copy of the
+    rasterized frame and returns an RGB image of the same size.
+    """
+    width, height = background.size
+    area = frame["qrArea"]
+    slot_x, slot_y = area["left"] / 100 * width, area["top"] / 100 * height
+    slot_w, slot_h = area["width"] / 100 * width, area["height"] / 100 * height
+
+    side = min(slot_w, slot_h) * (1 - 2 * QR_AREA_PADDING)
+    matrix = build_qr(data, border=1, error_correction=error_correction).get_matrix()
+    if side < len(matrix):
+        raise ValueError(f"{width}px is too small for this frame, the QR needs at least {min_frame_width(frame, len(matrix))}px")
+    # Whole pixels per module keep the modules sharp, the slot absorbs the remainder
+    box_size = max(1, int(side // len(matrix)))
+    qr_img = render_matrix_image(matrix, box_size, fill_color, back_color)
+
+    canvas = Image.new("RGB", background.size, "white")
+    canvas.paste(background, mask=background.split()[3])
+    offset_x = round(slot_x + (slot_w - qr_img.width) / 2)
+    offset_y = round(slot_y + (slot_h - qr_img.height) / 2)
+    canvas.paste(qr_img, (offset_x, offset_y))
+    return canvas
+
+def generate_framed_qr_png(data: str, frame_id: str, width: int, error_correction="L") -> bytes:
+    """
+    Renders the QR code for `data` inside a frame, `width` pixels wide, as PNG bytes.
+    """
+    frame = get_frame(frame_id)
+    img = compose_framed_qr(frame_background(frame["id"], width), frame, data, error_correction=error_correction)
+
+    img_byte_arr = BytesIO()
+    img.save(img_byte_arr, format='PNG')
+    return img_byte_arr.getvalue()
@@ -2,9 +2,17 @@ import os
 import google.generativeai as genai
 import hashlib
 import json
+import re
 import random
-from typing import Optional
+import time
+import asyncio
+from functools import lru_cache
+from typing import Callable, Optional
 from pydantic import BaseModel
+from app.services import metrics, fake_model
+from app.services.model_router import ModelRouter
+from app.services.rate_limiter import rate_limiter
+from app.services.tracing import span
 
 # Configure Gemini
 # Suppress the warning by using the recommended import if possible, 
@@ -15,6 +23,44 @@ from pydantic import BaseModel
 
 genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
 
+MODELS = ["gemini-2.5-flash-lite", "gemini-2.0-flash-lite", "gemini-2.0-flash"]
+
+# Per-model quota as (requests, tokens) per minute, shared by all worker
+# processes. Off by default, since paid keys have far higher quotas.
+# GEMINI_RATE_LIMITS="model=rpm:tpm,..." limits the listed models, and
+# GEMINI_RATE_LIMIT=1 applies the free-tier quotas below to the rest.
+FREE_TIER_LIMITS = {
+    "gemini-2.5-flash-lite": (15, 250000),
+    "gemini-2.0-flash-lite": (30, 1000000),
+    "gemini-2.0-flash": (15, 1000000),
+}
+RATE_LIMITS = dict(FREE_TIER_LIMITS) if os.environ.get("GEMINI_RATE_LIMIT", "0") == "1" else {}
+for entry in filter(None, os.environ.get("GEMINI_RATE_LIMITS", "").split(",")):
+    model_name, _, limits = entry.partition("=")
+    rpm, _, tpm = limits.partition(":")
+    RATE_LIMITS[model_name.strip()] = (float(rpm), float(tpm))
+if RATE_LIMITS:
+    print("Gemini rate limits (requests/min, tokens/min): " + ", ".join(
+        f"{name} {rpm:.0f}/{tpm:.0f}" for name, (rpm, tpm) in RATE_LIMITS.items()))
+# Reply tokens budgeted per request on top of the prompt
+OUTPUT_TOKENS_ESTIMATE = 300
+
+# Hedged requests: when a model has not answered within its hedge delay the
+# next model in MODELS is started as well, and the first valid review is used
+HEDGE_REQUESTS = os.environ.get("GEMINI_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("GEMINI_HEDGE_PERCENTILE", "90"))
+HEDGE_DELAY_SECONDS = float(os.environ.get("GEMINI_HEDGE_DELAY_SECONDS", "3.0"))
+# Latency samples before the percentile replaces HEDGE_DELAY_SECONDS; with
+# fewer, a high percentile is just the slowest call
+HEDGE_MIN_SAMPLES = int(os.environ.get("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+
+# With an on_text callback, responses are streamed and the review text is
+# reported as it arrives
+STREAM_OUTPUT = os.environ.get("GEMINI_STREAM", "1") == "1"
+
+# Health and latency per model; decides the order MODELS are tried in
+model_router = ModelRouter(MODELS)
+
 TONES = ["casual", "grateful", "impressed", "short and sweet", "detailed", "enthusiastic", "humorous", "direct"]
 LANGUAGES = ["english", "hindi", "hinglish", "gujarati"]
 
@@ -38,10 +84,72 @@ def calculate_similarity(text1: str, text2: str) -> float:
     
     return len(intersection) / len(union)
 
-async def generate_review(business_name: str, product_summary: str) -> GeneratedReview:
+class ReviewTextExtractor:
+    """
+    Incrementally decodes the "review_text" string of a streamed JSON reply.
+    feed() takes raw response chunks and returns the text decoded so far.
+    """
+    KEY = re.compile(r'"review_text"\s*:\s*"')
+    ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self):
+        self.raw = ""
+        self.pos = None  # index of the next undecoded character of the value
+        self.done = False
+        self.text = ""
+
+    def feed(self, chunk: str) -> str:
+        self.raw += chunk
+        if self.pos is None:
+            match = self.KEY.search(self.raw)
+            if not match:
+                return self.text
+            self.pos = match.end()
+
+        decoded = []
+        raw, pos = self.raw, self.pos
+        while pos < len(raw) and not self.done:
+            char = raw[pos]
+            if char == '"':
+                self.done = True
+                break
+            if char != "\\":
+                decoded.append(char)
+                pos += 1
+                continue
+            # Wait for the rest of an escape that was split across chunks
+            if pos + 1 >= len(raw):
+                break
+            if raw[pos + 1] != "u":
+                decoded.append(self.ESCAPES.get(raw[pos + 1], raw[pos + 1]))
+                pos += 2
+                continue
+            if pos + 6 > len(raw):
+                break
+            code = int(raw[pos + 2:pos + 6], 16)
+            if 0xD800 <= code < 0xDC00:
+                # Surrogate pair, needs the low half too
+                if pos + 12 > len(raw):
+                    break
+                low = int(raw[pos + 8:pos + 12], 16)
+                code = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)
+                pos += 6
+            decoded.append(chr(code))
+            pos += 6
+
+        self.pos = pos
+        self.text += "".join(decoded)
+        return self.text
+
+async def generate_review(business_name: str, product_summary: str, language: Optional[str] = None, on_text: Optional[Callable[[str], None]] = None) -> GeneratedReview:
+    """
+    on_text, if given, is called with the review text generated so far
+    whenever it grows. A later call may not extend an earlier one when a
+    model fails and the next one starts over.
+    """
     # Define base variables first
     tone = random.choice(TONES)
-    language = random.choice(LANGUAGES)
+    language = language or random.choice(LANGUAGES)
     allow_mistakes = random.random() < 0.3
     
     mistakes_instruction = (
@@ -103,16 +211,42 @@ async def generate_review(business_name: str, product_summary: str) -> Generated
     Do not include markdown formatting or explanations. Just the JSON.
     """
     
-    models = ["gemini-2.5-flash-lite", "gemini-2.0-flash-lite", "gemini-2.0-flash"]
-    
+    if HEDGE_REQUESTS:
+        return await generate_hedged(prompt, on_text)
+
     last_exception = None
 
-    for model_name in models:
+    for model_name in model_router.order():
         try:
-            print(f"Attempting to generate review using model: {model_name}")
-            model = genai.GenerativeModel(model_name)
-            response = await model.generate_content_async(prompt)
-            text = response.text
+            return await generate_with_model(model_name, prompt, on_text)
+        except Exception as e:
+            print(f"Error generating review with {model_name}: {e}")
+            last_exception = e
+            continue
+
+    # If all models fail, raise the last exception
+    if last_exception:
+        print("All models failed to generate review.")
+        raise last_exception
+
+@lru_cache(maxsize=None)
+def get_model(model_name: str) -> genai.GenerativeModel:
+    # Model objects hold no per-request state, so one per name is reused
+    if fake_model.ENABLED:
+        return fake_model.FakeModel(model_name)
+    return genai.GenerativeModel(model_name)
+
+async def generate_with_model(model_name: str, prompt: str, on_text: Optional[Callable[[str], None]] = None) -> GeneratedReview:
+    print(f"Attempting to generate review using model: {model_name}")
+    await wait_for_quota(model_name, prompt)
+    started = time.perf_counter()
+    try:
+        with span("gemini.attempt", model=model_name, streamed=bool(on_text and STREAM_OUTPUT)):
+            if on_text and STREAM_OUTPUT:
+                text = await stream_response(model_name, prompt, on_text)
+            else:
+                response = await get_model(model_name).generate_content_async(prompt)
+                text = response.text
             
             # Clean markdown
             cleaned_text = text.strip()
@@ -122,20 +256,115 @@ async def generate_review(business_name: str, product_summary: str) -> Generated
                 cleaned_text = cleaned_text[:-3]
             
             data = json.loads(cleaned_text)
-            
-            print(f"Successfully generated review with model: {model_name}")
-            return GeneratedReview(
-                reviewText=data.get("review_text"),
-                language=data.get("language"),
-                rating=data.get("rating")
-            )
-            
-        except Exception as e:
-            print(f"Error generating review with {model_name}: {e}")
-            last_exception = e
-            continue
+        
+        review = GeneratedReview(
+            reviewText=data.get("review_text"),
+            language=data.get("language"),
+            rating=data.get("rating")
+        )
+    except Exception:
+        # Not CancelledError: a hedged request that lost the race is not a failure
+        model_router.record(model_name, False, time.perf_counter() - started)
+        raise
 
-    # If all models fail, raise the last exception
-    if last_exception:
-        print("All models failed to generate review.")
-        raise last_exception
+    model_router.record(model_name, True, time.perf_counter() - started)
+    print(f"Successfully generated review with model: {model_name}")
+    return review
+
+async def wait_for_quota(model_name: str, prompt: str) -> None:
+    """
+    Waits for room in the model's request and token budgets. Raises
+    RateLimited when the wait would be too long, so the caller falls back
+    to the next model; this does not count against the model's health.
+    """
+    if model_name not in RATE_LIMITS:
+        return
+    requests_per_minute, tokens_per_minute = RATE_LIMITS[model_name]
+    with span("gemini.rate_limit", model=model_name):
+        await rate_limiter.acquire(
+            model_name,
+            {"requests": requests_per_minute, "tokens": tokens_per_minute},
+            # Roughly four characters per token
+            {"requests": 1, "tokens": len(prompt) / 4 + OUTPUT_TOKENS_ESTIMATE},
+        )
+
+async def stream_response(model_name: str, prompt: str, on_text: Callable[[str], None]) -> str:
+    """
+    Streams the reply, reporting the review text as it is decoded, and
+    returns the full response text.
+    """
+    extractor = ReviewTextExtractor()
+    chunks = []
+    response = await get_model(model_name).generate_content_async(prompt, stream=True)
+    async for chunk in response:
+        chunks.append(chunk.text)
+        previous = extractor.text
+        if extractor.feed(chunk.text) != previous:
+            on_text(extractor.text)
+    return "".join(chunks)
+
+def hedge_delay(model_name: str) -> float:
+    """
+    Seconds to wait for `model_name` before also trying the next model: the
+    HEDGE_PERCENTILE of its recent successful latencies, or HEDGE_DELAY_SECONDS
+    until there are HEDGE_MIN_SAMPLES of them.
+    """
+    delay = model_router.latency_percentile(model_name, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+    return HEDGE_DELAY_SECONDS if delay is None else delay
+
+async def generate_hedged(prompt: str, on_text: Optional[Callable[[str], None]] = None) -> GeneratedReview:
+    """
+    Walks the routed models like generate_review, but starts the next model as soon as the
+    newest one has failed or is slower than its hedge delay. The first valid
+    review wins and the other requests are cancelled. Only one request at a
+    time reports text: the first to stream any, until it fails.
+    """
+    remaining = model_router.order()
+    pending = {}
+    last_exception = None
+    streaming = {"model": None}
+
+    def text_reporter(model_name):
+        if on_text is None:
+            return None
+        def report(text):
+            if streaming["model"] in (None, model_name):
+                streaming["model"] = model_name
+                on_text(text)
+        return report
+
+    def launch():
+        model_name = remaining.pop(0)
+        pending[asyncio.create_task(generate_with_model(model_name, prompt, text_reporter(model_name)))] = model_name
+        return model_name
+
+    newest = launch()
+    try:
+        while pending:
+            timeout = hedge_delay(newest) if remaining else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                print(f"{newest} is slower than {timeout:.2f}s, hedging with the next model")
+                metrics.incr("gemini.hedged")
+                newest = launch()
+                continue
+
+            for task in done:
+                model_name = pending.pop(task)
+                if task.exception() is None:
+                    metrics.incr(f"gemini.won.{model_name}")
+                    return task.result()
+                print(f"Error generating review with {model_name}: {task.exception()}")
+                last_exception = task.exception()
+                if streaming["model"] == model_name:
+                    streaming["model"] = None
+
+            if remaining and not any(pending[task] == newest for task in pending):
+                newest = launch()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    print("All models failed to generate review.")
+    raise last_exception
@@ -0,0 +1,79 @@
+import os
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional
+from app.paths import CACHE_ROOT
+from app.services.qrcode_generator import RENDER_ENGINE, MASK_SELECTION
+
+# Two-tier cache for rendered QR images: a small in-memory LRU in front of
+# a content-addressed directory on disk. Entries are keyed by a hash of every
+# input that affects the rendered bytes, so they never need invalidation.
+
+CACHE_DIR = os.environ.get(
+    "QR_IMAGE_CACHE_DIR",
+    os.path.join(CACHE_ROOT, "qr-images"),
+)
+MEMORY_ITEMS = int(os.environ.get("QR_IMAGE_CACHE_ITEMS", "512"))
+
+def image_cache_key(**params) -> str:
+    """
+    Returns a stable hex digest for the render parameters (data, colors, box_size, ...).
+    """
+    payload = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def qr_image_key(format: str, render_params: dict) -> str:
+    """
+    Cache key for generate_qr_code_image/_svg output, including the generator
+    settings that change the bytes for the same parameters.
+    """
+    engine = RENDER_ENGINE if format == "png" else None
+    return image_cache_key(format=format, engine=engine, mask=MASK_SELECTION, **render_params)
+
+class ImageCache:
+    def __init__(self, directory: str, max_items: int):
+        self.directory = directory
+        self.max_items = max_items
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def _path(self, key: str) -> str:
+        # Shard by the first two hex chars to keep directories small
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        content = self._memory.get(key)
+        if content is not None:
+            self._memory.move_to_end(key)
+            return content
+
+        try:
+            with open(self._path(key), "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+
+        self._remember(key, content)
+        return content
+
+    def put(self, key: str, content: bytes) -> None:
+        self._remember(key, content)
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see a partial image
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing image cache entry {key}: {e}")
+
+    def _remember(self, key: str, content: bytes) -> None:
+        self._memory[key] = content
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+image_cache = ImageCache(CACHE_DIR, MEMORY_ITEMS)
@@ -0,0 +1,134 @@
+import asyncio
+from typing import Dict, Optional, Set
+from app.services import metrics
+from app.services.event_hub import event_hub
+
+# Channels that carry a running job's progress to the /api/reviews/stream
+# connections waiting on its jobId: partial review text, then review_ready
+# or error when it finishes. A channel keeps the latest text, so a client
+# that connects mid-generation starts from a snapshot. Every event also goes
+# out through the event hub, and receive() hands events from jobs running in
+# other worker processes to this process's connections.
+
+# Queued review_delta events per subscriber before further deltas are
+# dropped; review_ready and error are always queued
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+class JobChannel:
+    def __init__(self):
+        self.text = ""
+        self.subscribers: Set[asyncio.Queue] = set()
+        # Subscribers that missed deltas and get the full text next
+        self.lagging: Set[asyncio.Queue] = set()
+
+_channels: Dict[str, JobChannel] = {}
+
+def publish_text(job_id: str, text: str) -> None:
+    """
+    Records the review text generated so far for job_id and sends the change
+    to subscribers as a review_delta event. When the new text does not extend
+    the previous one (a retry started over), the event has reset=True and
+    carries the full text.
+    """
+    channel = _channels.setdefault(job_id, JobChannel())
+    reset = not text.startswith(channel.text)
+    offset = 0 if reset else len(channel.text)
+    _apply_text(channel, job_id, offset, text[offset:], reset)
+    # Other workers get the same delta, with the length of the text it extends
+    event_hub.publish({"type": "review_text", "jobId": job_id, "offset": offset, "text": text[offset:], "reset": reset})
+
+def publish_ready(job_id: str, review) -> None:
+    """
+    Signals that the TempReview for job_id has been stored.
+    """
+    event = {
+        "type": "review_ready",
+        "jobId": job_id,
+        "reviewText": review.reviewText,
+        "language": review.language,
+        "rating": review.rating,
+    }
+    _send(job_id, event)
+    event_hub.publish(event)
+
+def publish_failed(job_id: str) -> None:
+    """
+    Signals that job_id has failed for good and will not be retried.
+    """
+    event = {"type": "error", "jobId": job_id}
+    _send(job_id, event)
+    event_hub.publish(event)
+
+def receive(event: dict) -> None:
+    """
+    Delivers an event published by another worker process. Events for jobs
+    nobody here is waiting on are dropped.
+    """
+    if event["type"] == "review_text":
+        channel = _channels.get(event["jobId"])
+        if channel is not None:
+            _apply_text(channel, event["jobId"], event["offset"], event["text"], event["reset"])
+    else:
+        _send(event["jobId"], event)
+
+def _apply_text(channel: JobChannel, job_id: str, offset: int, delta: str, reset: bool) -> None:
+    if reset:
+        channel.text = delta
+    elif offset == len(channel.text):
+        channel.text += delta
+    else:
+        # Joined after another worker's job had started streaming; partial
+        # text resumes with the next reset, review_ready still arrives
+        return
+    _put(channel, {"type": "review_delta", "jobId": job_id, "text": delta, "reset": reset})
+
+def _send(job_id: str, event: dict) -> None:
+    channel = _channels.get(job_id)
+    if channel is not None:
+        _put(channel, event)
+
+def _put(channel: JobChannel, event: dict) -> None:
+    for queue in channel.subscribers:
+        if event["type"] != "review_delta":
+            queue.put_nowait(event)
+        elif queue.qsize() >= SUBSCRIBER_QUEUE_SIZE:
+            # A stalled client misses deltas, and catches up with a reset
+            channel.lagging.add(queue)
+            metrics.incr("job_events.deltas_dropped")
+        elif queue in channel.lagging:
+            channel.lagging.discard(queue)
+            queue.put_nowait({"type": "review_delta", "jobId": event["jobId"], "text": channel.text, "reset": True})
+        else:
+            queue.put_nowait(event)
+
+def subscribe(job_id: str, queue: Optional[asyncio.Queue] = None) -> asyncio.Queue:
+    """
+    Returns a queue of job_id's events. Passing a queue adds the job's
+    events to it, so one reader can follow several jobs. The queue must be
+    unbounded; _put limits the deltas in it.
+    """
+    channel = _channels.setdefault(job_id, JobChannel())
+    if queue is None:
+        queue = asyncio.Queue()
+    if channel.text:
+        queue.put_nowait({"type": "review_delta", "jobId": job_id, "text": channel.text, "reset": True})
+    channel.subscribers.add(queue)
+    return queue
+
+def unsubscribe(job_id: str, queue: asyncio.Queue) -> None:
+    channel = _channels.get(job_id)
+    if channel is None:
+        return
+    channel.subscribers.discard(queue)
+    channel.lagging.discard(queue)
+    if not channel.subscribers:
+        del _channels[job_id]
+
+def close(job_id: str) -> None:
+    """
+    Called when the job has finished. The channel stays while clients are
+    still connected to it.
+    """
+    channel = _channels.get(job_id)
+    if channel is not None and not channel.subscribers:
+        del _channels[job_id]
@@ -0,0 +1,214 @@
+import os
+import time
+import socket
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Set
+from nanoid import generate as nanoid
+from app.db import db
+from app.services import metrics
+from app.services.tracing import trace, span
+
+# Durable worker pool for review generation. Jobs are rows in the
+# GenerationJob table, so they survive restarts and can be shared by several
+# uvicorn workers. A worker claims a batch with one UPDATE ... RETURNING,
+# which SQLite runs atomically, and holds each job under a lease that it
+# renews while the job runs. A job whose lease runs out (its worker died) is
+# claimed again until it has used up maxAttempts.
+
+WORKERS = int(os.environ.get("REVIEW_WORKERS", "4"))
+MAX_QUEUED = int(os.environ.get("REVIEW_QUEUE_SIZE", "100"))
+MAX_ATTEMPTS = int(os.environ.get("REVIEW_JOB_ATTEMPTS", "3"))
+LEASE_SECONDS = float(os.environ.get("REVIEW_JOB_LEASE_SECONDS", "60"))
+RETRY_SECONDS = float(os.environ.get("REVIEW_JOB_RETRY_SECONDS", "5"))
+# Fallback poll for jobs queued by other processes or due for a retry
+POLL_SECONDS = float(os.environ.get("REVIEW_JOB_POLL_SECONDS", "1.0"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+CLAIM_SQL = """
+UPDATE "GenerationJob"
+SET "status" = 'running', "leaseOwner" = ?, "availableAt" = ?, "attempts" = "attempts" + 1
+WHERE "id" IN (
+    SELECT "id" FROM "GenerationJob"
+    WHERE "status" IN ('queued', 'running') AND "availableAt" <= ? AND "attempts" < "maxAttempts"
+    ORDER BY "availableAt"
+    LIMIT ?
+)
+RETURNING "id", "qrCodeId", "sessionId", "attempts", "maxAttempts", "enqueuedAt"
+"""
+
+# Running jobs whose lease expired on their last attempt
+EXPIRE_SQL = """
+UPDATE "GenerationJob"
+SET "status" = 'failed', "lastError" = 'lease expired', "leaseOwner" = NULL
+WHERE "status" = 'running' AND "availableAt" <= ? AND "attempts" >= "maxAttempts"
+"""
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+class QueueFull(Exception):
+    pass
+
+class JobScheduler:
+    def __init__(self, name: str, workers: int, max_queued: int):
+        self.name = name
+        self.workers = workers
+        self.max_queued = max_queued
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{nanoid(size=6)}"
+        self._handler: Optional[Callable[[dict], Awaitable]] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._running = {}
+        self._backlog = 0
+
+    def start(self, handler: Callable[[dict], Awaitable]) -> None:
+        """
+        Starts claiming jobs for handler(job), including ones left unfinished
+        by a previous run.
+        """
+        self._handler = handler
+        self._wakeup = asyncio.Event()
+        self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        """
+        Stops claiming and hands interrupted jobs back to the queue without
+        counting the interrupted attempt.
+        """
+        if self._poller is None:
+            return
+        self._poller.cancel()
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(self._poller, *tasks, return_exceptions=True)
+        self._poller = None
+
+        if self._running:
+            try:
+                await db.generationjob.update_many(
+                    where={"id": {"in": list(self._running)}, "leaseOwner": self.owner, "status": RUNNING},
+                    data={"status": QUEUED, "availableAt": 0, "leaseOwner": None, "attempts": {"decrement": 1}},
+                )
+            except Exception as e:
+                print(f"Error releasing {self.name} jobs: {e}")
+            self._running.clear()
+
+    def depth(self) -> int:
+        return self._backlog
+
+    def running(self) -> int:
+        return len(self._running)
+
+    async def submit(self, job_id: str, qr_code_id: str, session_id: Optional[str]) -> None:
+        """
+        Persists a queued job. Raises QueueFull when MAX_QUEUED jobs are
+        already waiting across all workers.
+        """
+        with span("db.generationjob.count"):
+            self._backlog = await db.generationjob.count(where={"status": QUEUED})
+        if self._backlog >= self.max_queued:
+            metrics.incr(f"{self.name}.rejected")
+            raise QueueFull(f"{self.name} queue is full ({self._backlog} jobs)")
+
+        timestamp = now_ms()
+        with span("db.generationjob.create"):
+            await db.generationjob.create(data={
+                "id": job_id,
+                "qrCodeId": qr_code_id,
+                "sessionId": session_id,
+                "maxAttempts": MAX_ATTEMPTS,
+                "availableAt": timestamp,
+                "enqueuedAt": timestamp,
+            })
+        self._backlog += 1
+        metrics.incr(f"{self.name}.submitted")
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def status(self, job_id: str) -> Optional[dict]:
+        job = await db.generationjob.find_unique(where={"id": job_id})
+        if not job:
+            return None
+        return {"jobId": job.id, "state": job.status, "attempts": job.attempts, "error": job.lastError}
+
+    async def failed(self, job_ids: List[str]) -> Set[str]:
+        """
+        The ids among job_ids that have failed for good, in one query.
+        """
+        jobs = await db.generationjob.find_many(where={"id": {"in": job_ids}, "status": FAILED})
+        return {job.id for job in jobs}
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                await db.execute_raw(EXPIRE_SQL, now_ms())
+                free = self.workers - len(self._running)
+                if free > 0:
+                    timestamp = now_ms()
+                    jobs = await db.query_raw(CLAIM_SQL, self.owner, timestamp + int(LEASE_SECONDS * 1000), timestamp, free)
+                    for job in jobs:
+                        job["waitMs"] = timestamp - int(job["enqueuedAt"])
+                        metrics.observe(f"{self.name}.wait_seconds", job["waitMs"] / 1000)
+                        self._running[job["id"]] = asyncio.create_task(self._run(job))
+                    self._backlog = await db.generationjob.count(where={"status": QUEUED})
+            except Exception as e:
+                print(f"Error claiming {self.name}: {e}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _run(self, job: dict) -> None:
+        started = time.monotonic()
+        heartbeat = asyncio.create_task(self._renew_lease(job["id"]))
+        try:
+            with trace(job["id"]), span(f"job.{self.name}", attempt=job["attempts"], waitMs=job["waitMs"]):
+                await self._handler(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error in {self.name} job {job['id']}: {e}")
+            await self._finish(job, error=str(e))
+        else:
+            await self._finish(job)
+        finally:
+            heartbeat.cancel()
+            metrics.observe(f"{self.name}.run_seconds", time.monotonic() - started)
+
+    async def _finish(self, job: dict, error: Optional[str] = None) -> None:
+        if error is None:
+            data = {"status": DONE, "leaseOwner": None, "lastError": None}
+        elif job["attempts"] >= job["maxAttempts"]:
+            data = {"status": FAILED, "leaseOwner": None, "lastError": error}
+        else:
+            retry_at = now_ms() + int(RETRY_SECONDS * 1000 * job["attempts"])
+            data = {"status": QUEUED, "leaseOwner": None, "lastError": error, "availableAt": retry_at, "enqueuedAt": retry_at}
+        metrics.incr(f"{self.name}.{'retried' if data['status'] == QUEUED else data['status']}")
+
+        try:
+            # Only while we still hold the lease, another worker may have taken it over
+            await db.generationjob.update_many(where={"id": job["id"], "leaseOwner": self.owner}, data=data)
+        except Exception as e:
+            print(f"Error finishing {self.name} job {job['id']}: {e}")
+        finally:
+            self._running.pop(job["id"], None)
+            self._wakeup.set()
+
+    async def _renew_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            try:
+                await db.generationjob.update_many(
+                    where={"id": job_id, "leaseOwner": self.owner},
+                    data={"availableAt": now_ms() + int(LEASE_SECONDS * 1000)},
+                )
+            except Exception as e:
+                print(f"Error renewing lease on {self.name} job {job_id}: {e}")
+
+review_scheduler = JobScheduler("review_jobs", WORKERS, MAX_QUEUED)
+metrics.register_gauge("review_jobs.queue_depth", review_scheduler.depth)
+metrics.register_gauge("review_jobs.running", review_scheduler.running)
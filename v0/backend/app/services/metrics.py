@@ -0,0 +1,35 @@
+from collections import Counter
+from typing import Callable, Dict
+
+# Process-local counters and gauges for GET /api/admin/metrics. Each worker
+# process reports its own numbers.
+
+_counters: "Counter[str]" = Counter()
+_gauges: Dict[str, Callable[[], float]] = {}
+_maxima: Dict[str, float] = {}
+
+def incr(name: str, value: int = 1) -> None:
+    _counters[name] += value
+
+def observe(name: str, value: float) -> None:
+    """
+    Records one sample as <name>.count, <name>.sum and <name>.max.
+    """
+    _counters[f"{name}.count"] += 1
+    _counters[f"{name}.sum"] += value
+    if value > _maxima.get(name, float("-inf")):
+        _maxima[name] = value
+
+def register_gauge(name: str, read: Callable[[], float]) -> None:
+    """
+    Registers a callable that is read each time a snapshot is taken.
+    """
+    _gauges[name] = read
+
+def snapshot() -> dict:
+    values = dict(_counters)
+    for name, value in _maxima.items():
+        values[f"{name}.max"] = value
+    for name, read in _gauges.items():
+        values[name] = read()
+    return dict(sorted(values.items()))
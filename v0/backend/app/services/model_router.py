@@ -0,0 +1,121 @@
+import os
+import time
+from collections import deque
+from typing import List, Optional
+from app.services import metrics
+
+# Orders model fallbacks by health and speed. Each model keeps a rolling
+# window of recent calls; consecutive failures open its circuit breaker, and
+# after a cooldown one request is let through as a half-open probe. A good
+# probe closes the breaker, a bad one reopens it with a doubled cooldown.
+
+WINDOW = int(os.environ.get("MODEL_STATS_WINDOW", "100"))
+# Samples needed before latency is used for ordering
+MIN_LATENCY_SAMPLES = 5
+BREAKER_FAILURES = int(os.environ.get("MODEL_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get("MODEL_BREAKER_COOLDOWN_SECONDS", "30"))
+BREAKER_MAX_COOLDOWN_SECONDS = float(os.environ.get("MODEL_BREAKER_MAX_COOLDOWN_SECONDS", "600"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+def percentile(sorted_values: list, p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+class ModelStats:
+    def __init__(self, name: str, priority: int):
+        self.name = name
+        self.priority = priority  # position in the configured fallback list
+        self.calls = deque(maxlen=WINDOW)  # (ok, seconds)
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.cooldown = BREAKER_COOLDOWN_SECONDS
+        self.retry_at = 0.0
+        self.probe_started = None
+
+    def latencies(self) -> list:
+        return sorted(seconds for ok, seconds in self.calls if ok)
+
+    def snapshot(self) -> dict:
+        latencies = self.latencies()
+        return {
+            "model": self.name,
+            "state": self.state,
+            "calls": len(self.calls),
+            "successRate": round(sum(ok for ok, _ in self.calls) / len(self.calls), 3) if self.calls else None,
+            "p50Ms": round(percentile(latencies, 50) * 1000) if latencies else None,
+            "p95Ms": round(percentile(latencies, 95) * 1000) if latencies else None,
+            "consecutiveFailures": self.consecutive_failures,
+            "retryInSeconds": round(max(0.0, self.retry_at - time.monotonic()), 1) if self.state != CLOSED else None,
+        }
+
+class ModelRouter:
+    def __init__(self, models: List[str]):
+        self.models = {name: ModelStats(name, index) for index, name in enumerate(models)}
+
+    def order(self, probe: bool = True) -> List[str]:
+        """
+        Models to try for one request, fastest healthy model first. A model
+        whose breaker cooldown has passed goes first for one request, as the
+        probe (the rest still back it up); probe=False only looks, for reporting.
+        """
+        now = time.monotonic()
+        candidates = []
+        probing = set()
+        for stats in self.models.values():
+            state = stats.state
+            if state == OPEN and now >= stats.retry_at:
+                state = HALF_OPEN
+            if state == HALF_OPEN:
+                # One probe at a time; a probe that never reported back expires
+                if stats.probe_started is not None and now - stats.probe_started < stats.cooldown:
+                    continue
+                if probe:
+                    stats.state, stats.probe_started = HALF_OPEN, now
+                probing.add(stats.name)
+            elif state == OPEN:
+                continue
+            candidates.append(stats)
+
+        if not candidates:
+            # Every breaker is open; trying beats failing outright
+            candidates = list(self.models.values())
+
+        def speed(stats):
+            latencies = stats.latencies()
+            is_probe = stats.name in probing
+            if len(latencies) < MIN_LATENCY_SAMPLES:
+                return (not is_probe, float("inf"), stats.priority)
+            return (not is_probe, percentile(latencies, 50), stats.priority)
+
+        return [stats.name for stats in sorted(candidates, key=speed)]
+
+    def latency_percentile(self, model: str, p: float, min_samples: int = MIN_LATENCY_SAMPLES) -> Optional[float]:
+        latencies = self.models[model].latencies()
+        return percentile(latencies, p) if len(latencies) >= min_samples else None
+
+    def record(self, model: str, ok: bool, seconds: float) -> None:
+        stats = self.models[model]
+        stats.calls.append((ok, seconds))
+        if ok:
+            if stats.state != CLOSED:
+                print(f"Circuit breaker for {model} closed")
+            stats.state, stats.consecutive_failures = CLOSED, 0
+            stats.cooldown, stats.probe_started = BREAKER_COOLDOWN_SECONDS, None
+            return
+
+        stats.consecutive_failures += 1
+        if stats.state == HALF_OPEN:
+            stats.cooldown = min(stats.cooldown * 2, BREAKER_MAX_COOLDOWN_SECONDS)
+            self._open(stats)
+        elif stats.state == CLOSED and stats.consecutive_failures >= BREAKER_FAILURES:
+            self._open(stats)
+
+    def _open(self, stats: ModelStats) -> None:
+        stats.state = OPEN
+        stats.retry_at = time.monotonic() + stats.cooldown
+        stats.probe_started = None
+        metrics.incr(f"gemini.breaker_opened.{stats.name}")
+        print(f"Circuit breaker for {stats.name} opened for {stats.cooldown:.0f}s")
+
+    def snapshot(self) -> List[dict]:
+        return [stats.snapshot() for stats in self.models.values()]
@@ -0,0 +1,159 @@
+import zlib
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+from PIL import Image
+from app.services.qrcode_generator import build_qr, render_matrix_image
+from app.services.frames import get_frame, frame_background, compose_framed_qr, min_frame_width
+
+# Page sizes in PDF points (1/72 inch)
+PAGE_SIZES = {"A4": (595.28, 841.89), "Letter": (612.0, 792.0)}
+MM = 72 / 25.4
+
+def tile_data(qr_code) -> str:
+    return f"http://localhost:3000/visit/{qr_code.id}"
+
+class PrintLayout:
+    """
+    Grid geometry for a print sheet. The frame background, if any, is
+    rasterized (or taken from the frame cache) once here and reused for
+    every tile of the job. longest_data is the longest payload on the
+    sheet, the one that needs the most room in a frame's QR slot.
+    """
+    def __init__(self, columns=3, rows=4, dpi=300, page="A4", margin_mm=10, gap_mm=6, frame_id: Optional[str] = None, longest_data: str = ""):
+        self.columns, self.rows, self.dpi = columns, rows, dpi
+        self.page_w, self.page_h = PAGE_SIZES[page]
+        self.margin, self.gap = margin_mm * MM, gap_mm * MM
+
+        self.cell_w = (self.page_w - 2 * self.margin - (columns - 1) * self.gap) / columns
+        self.cell_h = (self.page_h - 2 * self.margin - (rows - 1) * self.gap) / rows
+        if self.cell_w <= 0 or self.cell_h <= 0:
+            raise ValueError("Too many columns or rows for the page size")
+
+        self.frame = None
+        self.background = None
+        aspect = 1.0
+        if frame_id:
+            self.frame = get_frame(frame_id)
+            if self.frame is None:
+                raise ValueError(f"Unknown frame: {frame_id}")
+            _, _, vb_w, vb_h = self.frame["viewBox"]
+            aspect = vb_h / vb_w
+
+        # Largest tile with the right aspect ratio that fits in a cell
+        self.tile_w = min(self.cell_w, self.cell_h / aspect)
+        self.tile_h = self.tile_w * aspect
+        self.tile_px = round(self.tile_w / 72 * dpi)
+
+        if self.frame is not None:
+            # compose_framed_qr would only fail mid-stream, with the PDF half sent
+            modules = len(build_qr(longest_data, border=1).get_matrix())
+            min_width = min_frame_width(self.frame, modules)
+            if self.tile_px < min_width:
+                raise ValueError(
+                    f"Tiles are {self.tile_px}px at {dpi} dpi, this frame needs at least {min_width}px; "
+                    "use fewer columns or rows or a higher dpi"
+                )
+            self.background = frame_background(self.frame["id"], self.tile_px)
+
+    @property
+    def per_page(self) -> int:
+        return self.columns * self.rows
+
+    def render_tile(self, data: str):
+        """
+        Returns (image dictionary, compressed pixels, width px, height px) for one tile.
+        """
+        if self.background is not None:
+            img = compose_framed_qr(self.background, self.frame, data)
+            return "/ColorSpace /DeviceRGB /BitsPerComponent 8", img.tobytes(), img.width, img.height
+
+        matrix = build_qr(data, border=4).get_matrix()
+        box_size = max(1, self.tile_px // len(matrix))
+        # Mode "1" packs 8 pixels per byte with 1 = white, exactly DeviceGray at 1 bit
+        img = render_matrix_image(matrix, box_size).convert("1", dither=Image.NONE)
+        return "/ColorSpace /DeviceGray /BitsPerComponent 1", img.tobytes(), img.width, img.height
+
+class _PdfWriter:
+    """
+    Emits PDF objects as bytes as soon as they are complete and only keeps
+    their offsets for the cross-reference table.
+    """
+    CATALOG, PAGES = 1, 2
+
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+        self.last_id = self.PAGES
+
+    def _emit(self, data: bytes) -> bytes:
+        self.position += len(data)
+        return data
+
+    def header(self) -> bytes:
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def reserve(self) -> int:
+        self.last_id += 1
+        return self.last_id
+
+    def obj(self, num: int, body: bytes) -> bytes:
+        self.offsets[num] = self.position
+        return self._emit(f"{num} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    def stream(self, num: int, dictionary: str, content: bytes) -> bytes:
+        content = zlib.compress(content, 6)
+        head = f"<< {dictionary} /Filter /FlateDecode /Length {len(content)} >>\nstream\n".encode()
+        return self.obj(num, head + content + b"\nendstream")
+
+    def trailer(self) -> bytes:
+        xref_offset = self.position
+        lines = [f"xref\n0 {self.last_id + 1}\n", "0000000000 65535 f \n"]
+        lines += [f"{self.offsets[num]:010d} 00000 n \n" for num in range(1, self.last_id + 1)]
+        lines.append(f"trailer\n<< /Size {self.last_id + 1} /Root {self.CATALOG} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        return self._emit("".join(lines).encode())
+
+def iter_print_sheet_pdf(qr_codes: Iterable, layout: PrintLayout) -> Iterator[bytes]:
+    """
+    Yields a multi-page PDF with layout.per_page QR codes per page. Tiles are
+    rendered and written one at a time, so memory does not grow with the job.
+    """
+    pdf = _PdfWriter()
+    page_ids = []
+    yield pdf.header()
+
+    qr_codes = iter(qr_codes)
+    while True:
+        page_items = list(islice(qr_codes, layout.per_page))
+        if not page_items:
+            break
+
+        xobjects, content = [], []
+        for index, qr_code in enumerate(page_items):
+            row, column = divmod(index, layout.columns)
+            image_dict, pixels, width, height = layout.render_tile(tile_data(qr_code))
+
+            image_id = pdf.reserve()
+            yield pdf.stream(image_id, f"/Type /XObject /Subtype /Image /Width {width} /Height {height} {image_dict}", pixels)
+            xobjects.append(f"/Im{index} {image_id} 0 R")
+
+            # Draw at exactly layout.dpi, centered in the cell (PDF y grows upwards)
+            draw_w, draw_h = width * 72 / layout.dpi, height * 72 / layout.dpi
+            x = layout.margin + column * (layout.cell_w + layout.gap) + (layout.cell_w - draw_w) / 2
+            top = layout.margin + row * (layout.cell_h + layout.gap) + (layout.cell_h - draw_h) / 2
+            y = layout.page_h - top - draw_h
+            content.append(f"q {draw_w:.3f} 0 0 {draw_h:.3f} {x:.3f} {y:.3f} cm /Im{index} Do Q")
+
+        content_id = pdf.reserve()
+        yield pdf.stream(content_id, "", "\n".join(content).encode())
+
+        page_id = pdf.reserve()
+        page_ids.append(page_id)
+        yield pdf.obj(page_id, (
+            f"<< /Type /Page /Parent {pdf.PAGES} 0 R /MediaBox [0 0 {layout.page_w} {layout.page_h}] "
+            f"/Resources << /XObject << {' '.join(xobjects)} >> >> /Contents {content_id} 0 R >>"
+        ).encode())
+
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    yield pdf.obj(pdf.PAGES, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode())
+    yield pdf.obj(pdf.CATALOG, f"<< /Type /Catalog /Pages {pdf.PAGES} 0 R >>".encode())
+    yield pdf.trailer()
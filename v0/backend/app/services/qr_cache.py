@@ -0,0 +1,65 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.db import db
+from app.services import metrics
+from app.services.tracing import span
+
+# Read-through cache for QRCode rows on the scan and image paths. QR metadata
+# is effectively immutable after creation, so entries live for a TTL and the
+# admin router invalidates ids it writes. Unknown ids are cached as well
+# (for a shorter time) so mistyped ids don't reach SQLite on every scan.
+
+TTL_SECONDS = float(os.environ.get("QR_RECORD_CACHE_TTL", "300"))
+NEGATIVE_TTL_SECONDS = float(os.environ.get("QR_RECORD_CACHE_NEGATIVE_TTL", "30"))
+MAX_ITEMS = int(os.environ.get("QR_RECORD_CACHE_ITEMS", "10000"))
+
+class QRRecordCache:
+    def __init__(self, ttl: float, negative_ttl: float, max_items: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_items = max_items
+        # id -> (expires at, QRCode or None)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, qr_id: str):
+        """
+        Returns the QRCode for `qr_id`, or None if it does not exist.
+        """
+        entry = self._entries.get(qr_id)
+        if entry is not None:
+            expires_at, qr_code = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(qr_id)
+                metrics.incr("qr_record_cache.hit" if qr_code is not None else "qr_record_cache.negative_hit")
+                return qr_code
+            del self._entries[qr_id]
+
+        metrics.incr("qr_record_cache.miss")
+        with span("db.qrcode.find_unique"):
+            qr_code = await db.qrcode.find_unique(where={"id": qr_id})
+        self.put(qr_id, qr_code)
+        return qr_code
+
+    def put(self, qr_id: str, qr_code) -> None:
+        ttl = self.ttl if qr_code is not None else self.negative_ttl
+        self._entries[qr_id] = (time.monotonic() + ttl, qr_code)
+        self._entries.move_to_end(qr_id)
+        while len(self._entries) > self.max_items:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, qr_id: Optional[str] = None) -> None:
+        """
+        Drops one id, or every entry when called without one.
+        """
+        if qr_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(qr_id, None)
+
+qr_record_cache = QRRecordCache(TTL_SECONDS, NEGATIVE_TTL_SECONDS, MAX_ITEMS)
+metrics.register_gauge("qr_record_cache.size", lambda: len(qr_record_cache))
@@ -0,0 +1,110 @@
+import os
+import re
+import asyncio
+import zipfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterable, Optional
+from app.services.qrcode_generator import generate_qr_code_image, generate_qr_code_svg
+from app.services.image_cache import image_cache, qr_image_key
+
+EXPORT_WORKERS = int(os.environ.get("QR_EXPORT_WORKERS", os.cpu_count() or 2))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_render_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the parent runs an event loop and threadpool threads
+        _pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def shutdown_render_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+def _render(format: str, params: dict) -> bytes:
+    if format == "svg":
+        return generate_qr_code_svg(**params)
+    return generate_qr_code_image(**params)
+
+class _ZipSink:
+    """
+    Write-only file object for ZipFile. Having no tell()/seek() makes zipfile
+    fall back to streaming mode (data descriptors after each entry).
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def export_filename(qr_code, format: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", qr_code.businessName or "").strip("-").lower()
+    return f"{slug}_{qr_code.id}.{format}" if slug else f"{qr_code.id}.{format}"
+
+async def stream_qr_zip(qr_codes: Iterable, format: str = "png", box_size: int = 10) -> AsyncIterator[bytes]:
+    """
+    Renders QR images across the process pool and yields a ZIP archive as it is
+    built. Only a bounded window of renders is in flight, and each finished
+    entry is handed to the client before the next one is written.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    window = deque()
+    sink = _ZipSink()
+
+    # PNGs are already deflated, only SVG text benefits from compression
+    compression = zipfile.ZIP_DEFLATED if format == "svg" else zipfile.ZIP_STORED
+
+    with zipfile.ZipFile(sink, mode="w", compression=compression) as archive:
+        async def write_oldest():
+            name, key, pending = window.popleft()
+            content = await pending
+            if key is not None:
+                image_cache.put(key, content)
+            archive.writestr(name, content)
+            return sink.drain()
+
+        for qr_code in qr_codes:
+            params = {
+                "data": f"http://localhost:3000/visit/{qr_code.id}",
+                "fill_color": "black",
+                "back_color": "white",
+                "border": 4,
+                "error_correction": "L",
+            }
+            if format == "svg":
+                key = qr_image_key("svg", params)
+            else:
+                params["box_size"] = box_size
+                key = qr_image_key("png", params)
+
+            cached = image_cache.get(key)
+            if cached is not None:
+                pending, key = loop.create_future(), None
+                pending.set_result(cached)
+            else:
+                pending = asyncio.wrap_future(pool.submit(_render, format, params))
+            window.append((export_filename(qr_code, format), key, pending))
+
+            if len(window) >= EXPORT_WORKERS * 2:
+                yield await write_oldest()
+
+        while window:
+            yield await write_oldest()
+
+    # Central directory is written on close
+    yield sink.drain()
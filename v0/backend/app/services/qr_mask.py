@@ -0,0 +1,116 @@
+from functools import lru_cache
+import numpy as np
+import qrcode
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Mask selection with NumPy. The qrcode library builds the symbol once per
+# mask and scores each one with pure-Python penalty loops; here the data bits
+# are placed once and all 8 masked variants are scored as one (8, n, n) array.
+# Scores follow qrcode.util.lost_point, so the chosen mask is the same.
+
+# 1:1:3:1:1 finder-like pattern with 4 light modules after or before it
+FINDER_PATTERNS = np.array([
+    [1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0],
+    [0, 0, 0, 0, 1, 0, 1, 1, 1, 0, 1],
+], dtype=bool)
+
+MEMO_SIZE = 1024
+_memo = {}
+
+@lru_cache(maxsize=None)
+def _mask_stack(size: int) -> np.ndarray:
+    i, j = np.indices((size, size))
+    return np.stack([
+        (i + j) % 2 == 0,
+        i % 2 == 0,
+        j % 3 == 0,
+        (i + j) % 3 == 0,
+        (i // 2 + j // 3) % 2 == 0,
+        (i * j) % 2 + (i * j) % 3 == 0,
+        ((i * j) % 2 + (i * j) % 3) % 2 == 0,
+        ((i * j) % 3 + (i + j) % 2) % 2 == 0,
+    ])
+
+@lru_cache(maxsize=None)
+def _data_region(version: int) -> np.ndarray:
+    """
+    Boolean matrix of the modules that carry (masked) data bits for a version.
+    """
+    size = version * 4 + 17
+    probe = qrcode.QRCode(version=version)
+    probe.modules_count = size
+    probe.modules = [[None] * size for _ in range(size)]
+    probe.setup_position_probe_pattern(0, 0)
+    probe.setup_position_probe_pattern(size - 7, 0)
+    probe.setup_position_probe_pattern(0, size - 7)
+    probe.setup_position_adjust_pattern()
+    probe.setup_timing_pattern()
+    probe.setup_type_info(True, 0)
+    if version >= 7:
+        probe.setup_type_number(True)
+    return np.array([[cell is None for cell in row] for row in probe.modules])
+
+def _run_penalty(stack: np.ndarray) -> np.ndarray:
+    """
+    N1: every horizontal run of 5+ same-colored modules costs (length - 2).
+    """
+    count, rows, cols = stack.shape
+    boundaries = np.ones((count, rows, cols + 1), dtype=bool)
+    boundaries[:, :, 1:cols] = stack[:, :, 1:] != stack[:, :, :-1]
+    starts = np.flatnonzero(boundaries)
+    lengths = np.diff(starts)
+    # Row ends and the next row's start are adjacent, that gap is a length-1 "run"
+    long_runs = lengths >= 5
+    owner = starts[:-1][long_runs] // (rows * (cols + 1))
+    return np.bincount(owner, weights=lengths[long_runs] - 2, minlength=count)
+
+def _finder_penalty(stack: np.ndarray) -> np.ndarray:
+    windows = sliding_window_view(stack, 11, axis=2)
+    matches = (windows[:, :, :, None, :] == FINDER_PATTERNS).all(axis=-1)
+    return matches.sum(axis=(1, 2, 3)) * 40
+
+def penalty_scores(stack: np.ndarray) -> np.ndarray:
+    """
+    Penalty score of each (n, n) symbol in an (k, n, n) boolean stack.
+    """
+    columns = stack.transpose(0, 2, 1)
+    score = _run_penalty(stack) + _run_penalty(columns)
+
+    top_left = stack[:, :-1, :-1]
+    blocks = (top_left == stack[:, 1:, :-1]) & (top_left == stack[:, :-1, 1:]) & (top_left == stack[:, 1:, 1:])
+    score += blocks.sum(axis=(1, 2)) * 3
+
+    score += _finder_penalty(stack) + _finder_penalty(columns)
+
+    size = stack.shape[1]
+    percent = stack.sum(axis=(1, 2)) / size ** 2
+    score += (np.abs(percent * 100 - 50) // 5) * 10
+    return score
+
+def choose_mask(qr: qrcode.QRCode) -> int:
+    """
+    Returns the lowest-penalty mask for a QRCode whose data was added and
+    whose version is already fitted.
+    """
+    qr.makeImpl(True, 0)
+    masked = np.array(qr.modules, dtype=bool)
+    data = _data_region(qr.version)
+    masks = _mask_stack(qr.modules_count) & data
+
+    unmasked = masked ^ masks[0]
+    return int(np.argmin(penalty_scores(unmasked ^ masks)))
+
+def memoized_mask(qr: qrcode.QRCode, payload_length: int) -> int:
+    """
+    choose_mask() memoized by (version, error correction, payload length).
+    A remembered mask is always valid but may not be the lowest-penalty one
+    for this particular payload.
+    """
+    key = (qr.version, qr.error_correction, payload_length)
+    mask = _memo.get(key)
+    if mask is None:
+        mask = choose_mask(qr)
+        if len(_memo) >= MEMO_SIZE:
+            _memo.clear()
+        _memo[key] = mask
+    return mask
@@ -1,21 +1,72 @@
 import qrcode
 from io import BytesIO
 import base64
+import os
+import struct
+import zlib
+from PIL import Image, ImageColor
+from xml.sax.saxutils import quoteattr
 
-def generate_qr_code_image(data: str, fill_color="black", back_color="white") -> bytes:
-    """
-    Generates a QR code image and returns it as bytes (PNG format).
-    """
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the PIL path below still works without it
+    np = None
+
+if np is not None:
+    from app.services.qr_mask import choose_mask, memoized_mask
+
+ERROR_CORRECTION_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+# "numpy" rasterizes the module matrix with array ops, "pil" uses the qrcode image factory
+RENDER_ENGINE = "numpy" if np is not None and os.environ.get("QR_RENDER_ENGINE", "numpy") == "numpy" else "pil"
+
+# Mask selection: "numpy" scores all 8 masks as one array (same choice as the library),
+# "memo" additionally reuses the mask per (version, error correction, payload length),
+# "library" lets qrcode try each mask with its pure-Python penalty loops
+MASK_SELECTION = os.environ.get("QR_MASK_SELECTION", "numpy") if np is not None else "library"
+
+def build_qr(data: str, border=4, error_correction="L", box_size=10, mask_selection=None) -> qrcode.QRCode:
+    mask_selection = mask_selection or MASK_SELECTION
     qr = qrcode.QRCode(
         version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+        box_size=box_size,
+        border=border,
     )
     qr.add_data(data)
+
+    if mask_selection != "library":
+        # The version depends on how the data splits into encoding modes, so it is
+        # always fitted (a bisect); only the mask search is replaced
+        qr.best_fit(start=qr.version)
+        if mask_selection == "memo":
+            qr.mask_pattern = memoized_mask(qr, len(data.encode()))
+        else:
+            qr.mask_pattern = choose_mask(qr)
+
     qr.make(fit=True)
+    return qr
+
+def generate_qr_code_image(data: str, fill_color="black", back_color="white", box_size=10, border=4, error_correction="L", palette=False, engine=None) -> bytes:
+    """
+    Generates a QR code image and returns it as bytes (PNG format).
+    palette=True writes a 1-bit indexed PNG, which is several times smaller.
+    """
+    engine = engine or RENDER_ENGINE
+    qr = build_qr(data, border=border, error_correction=error_correction, box_size=box_size)
+
+    if engine == "numpy":
+        return render_matrix_png(qr.get_matrix(), box_size, fill_color, back_color, palette=palette)
 
     img = qr.make_image(fill_color=fill_color, back_color=back_color)
+    if palette and img.mode != "1":
+        # Two colors quantize exactly, PIL then writes a 1-bit indexed PNG
+        img = img.get_image().convert("RGB").quantize(colors=2)
     
     # Save to bytes
     img_byte_arr = BytesIO()
@@ -23,3 +74,106 @@ def generate_qr_code_image(data: str, fill_color="black", back_color="white") ->
     img_byte_arr.seek(0)
     
     return img_byte_arr.getvalue()
+
+def _png_chunk(tag: bytes, body: bytes) -> bytes:
+    return struct.pack(">I", len(body)) + tag + body + struct.pack(">I", zlib.crc32(tag + body) & 0xFFFFFFFF)
+
+def render_matrix_png(matrix, box_size: int, fill_color="black", back_color="white", palette=False) -> bytes:
+    """
+    Upscales a boolean module matrix (True = dark, border included) to box_size
+    pixels per module and encodes the PNG straight from the array buffer.
+    """
+    modules = np.asarray(matrix, dtype=bool)
+    height, width = modules.shape[0] * box_size, modules.shape[1] * box_size
+
+    fill_rgb = ImageColor.getrgb(fill_color)[:3]
+    back_rgb = ImageColor.getrgb(back_color)[:3]
+
+    if fill_rgb == (0, 0, 0) and back_rgb == (255, 255, 255):
+        # Plain black on white fits 1-bit grayscale, same as the PIL factory's mode "1"
+        rows = np.packbits(~modules.repeat(box_size, axis=0).repeat(box_size, axis=1), axis=1)
+        header = struct.pack(">IIBBBBB", width, height, 1, 0, 0, 0, 0)
+        extra = b""
+    elif palette:
+        # Color type 3, bit depth 1: index 0 is the background, index 1 the modules
+        rows = np.packbits(modules.repeat(box_size, axis=0).repeat(box_size, axis=1), axis=1)
+        header = struct.pack(">IIBBBBB", width, height, 1, 3, 0, 0, 0)
+        extra = _png_chunk(b"PLTE", bytes(back_rgb) + bytes(fill_rgb))
+    else:
+        # Map colors at module resolution, then upscale the RGB array
+        colors = np.array([back_rgb, fill_rgb], dtype=np.uint8)
+        rgb = colors[modules.view(np.uint8)].repeat(box_size, axis=0).repeat(box_size, axis=1)
+        rows = rgb.reshape(height, width * 3)
+        header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+        extra = b""
+
+    # The first scanline of each module row uses filter 1 (Sub), which zeroes
+    # runs of equal pixels; the box_size - 1 copies below it use filter 2 (Up),
+    # which turns them into all zeros.
+    bpp = 3 if header[8] == 8 else 1
+    raw = np.empty((height, rows.shape[1] + 1), dtype=np.uint8)
+    raw[:, 0] = 2
+    raw[:, 1:] = rows
+    raw[1:, 1:] -= rows[:-1]
+    sub = raw[::box_size]
+    sub[:, 0] = 1
+    sub[:, 1:] = rows[::box_size]
+    sub[:, 1 + bpp:] -= rows[::box_size, :-bpp]
+
+    # Filtered QR scanlines are long runs of identical bytes. Z_RLE compresses
+    # large buffers much faster; small ones compress tighter with the default.
+    strategy = zlib.Z_RLE if raw.nbytes > 1 << 20 else zlib.Z_DEFAULT_STRATEGY
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 15, 9, strategy)
+
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", header),
+        extra,
+        _png_chunk(b"IDAT", compressor.compress(raw.tobytes()) + compressor.flush()),
+        _png_chunk(b"IEND", b""),
+    ])
+
+def render_matrix_image(matrix, box_size: int, fill_color="black", back_color="white") -> Image.Image:
+    """
+    Returns the module matrix as an RGB PIL image with box_size pixels per module,
+    for compositing into larger images.
+    """
+    size = len(matrix)
+    img = Image.new("P", (size, size))
+    img.putpalette(ImageColor.getrgb(back_color)[:3] + ImageColor.getrgb(fill_color)[:3])
+    img.putdata([1 if dark else 0 for row in matrix for dark in row])
+    return img.resize((size * box_size, size * box_size), Image.NEAREST).convert("RGB")
+
+def generate_qr_code_svg(data: str, fill_color="black", back_color="white", border=4, error_correction="L") -> bytes:
+    """
+    Generates a QR code as a scalable SVG document (one unit per module).
+    Horizontal runs of dark modules are merged into single rectangles of one <path>.
+    """
+    qr = build_qr(data, border=border, error_correction=error_correction)
+    matrix = qr.get_matrix()
+    size = len(matrix)
+
+    # Each rectangle is a relative move from the previous one's start point,
+    # which is where "z" leaves the pen, keeping the coordinates short
+    segments = []
+    pen_x, pen_y = 0, 0
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            run = x - start
+            segments.append(f"m{start - pen_x} {y - pen_y}h{run}v1h-{run}z")
+            pen_x, pen_y = start, y
+
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill={quoteattr(back_color)}/>'
+        f'<path fill={quoteattr(fill_color)} d="{"".join(segments)}"/>'
+        f'</svg>'
+    )
+    return svg.encode()
@@ -0,0 +1,101 @@
+import os
+import time
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, List, Tuple
+from starlette.concurrency import run_in_threadpool
+from app.paths import CACHE_ROOT
+from app.services import metrics
+
+# Token buckets shared by every worker process on the host. Bucket state
+# lives in a small SQLite file, and each acquire refills and takes from its
+# buckets inside one write transaction, so concurrent workers never spend the
+# same budget twice. Callers over budget wait for the refill (up to
+# MAX_WAIT_SECONDS) instead of failing right away.
+
+DB_PATH = os.environ.get(
+    "RATE_LIMIT_DB",
+    os.path.join(CACHE_ROOT, "rate-limits.sqlite3"),
+)
+MAX_WAIT_SECONDS = float(os.environ.get("RATE_LIMIT_MAX_WAIT_SECONDS", "10"))
+# Bucket capacity as a share of the per-minute budget; a full minute's worth
+# at once would let a burst plus the refill exceed the quota window
+BURST_FRACTION = float(os.environ.get("RATE_LIMIT_BURST_FRACTION", "0.25"))
+
+class RateLimited(Exception):
+    pass
+
+class TokenBucketLimiter:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def try_take(self, wants: List[Tuple[str, float, float]]) -> float:
+        """
+        wants holds (bucket, per-minute budget, cost). Takes the cost from
+        every bucket if all of them have enough, and returns 0. Otherwise
+        takes nothing and returns the seconds until they should.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            names = [name for name, _, _ in wants]
+            stored = dict(((row[0], (row[1], row[2])) for row in conn.execute(
+                f"SELECT name, tokens, updated FROM buckets WHERE name IN ({','.join('?' * len(names))})", names)))
+
+            levels, wait = {}, 0.0
+            for name, per_minute, cost in wants:
+                capacity = max(1.0, per_minute * BURST_FRACTION)
+                rate = per_minute / 60
+                tokens, updated = stored.get(name, (capacity, now))
+                tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+                cost = min(cost, capacity)  # a request larger than the bucket waits for a full one
+                levels[name] = (tokens, cost)
+                if tokens < cost:
+                    wait = max(wait, (cost - tokens) / rate)
+
+            if wait == 0:
+                levels = {name: (tokens - cost, cost) for name, (tokens, cost) in levels.items()}
+            conn.executemany(
+                "INSERT INTO buckets (name, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                [(name, tokens, now) for name, (tokens, _) in levels.items()],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    async def acquire(self, key: str, limits: Dict[str, float], costs: Dict[str, float]) -> float:
+        """
+        Waits until every budget in limits (e.g. {"requests": 15, "tokens":
+        250000} per minute) has room for costs, and returns the seconds
+        waited. Raises RateLimited after MAX_WAIT_SECONDS.
+        """
+        wants = [(f"{key}:{kind}", per_minute, costs.get(kind, 0)) for kind, per_minute in limits.items()]
+        started = time.perf_counter()
+        while True:
+            wait = await run_in_threadpool(self.try_take, wants)
+            waited = time.perf_counter() - started
+            if wait == 0:
+                metrics.observe(f"rate_limit.wait_seconds.{key}", waited)
+                return waited
+            if waited + wait > MAX_WAIT_SECONDS:
+                metrics.incr(f"rate_limit.rejected.{key}")
+                raise RateLimited(f"{key} is over its rate limit (next slot in {wait:.1f}s)")
+            await asyncio.sleep(wait)
+
+rate_limiter = TokenBucketLimiter(DB_PATH)
@@ -0,0 +1,78 @@
+import os
+import asyncio
+from typing import Optional
+from app.db import db
+from app.services import metrics
+
+# Write-behind buffer for ScanLog rows. Request handlers and tasks append
+# rows without waiting on SQLite; a background task writes them with one
+# create_many whenever MAX_ROWS are pending or FLUSH_SECONDS have passed.
+
+MAX_ROWS = int(os.environ.get("SCAN_LOG_FLUSH_ROWS", "200"))
+FLUSH_SECONDS = float(os.environ.get("SCAN_LOG_FLUSH_SECONDS", "1.0"))
+# Rows kept for retry while the database is failing, oldest dropped beyond this
+MAX_PENDING = int(os.environ.get("SCAN_LOG_MAX_PENDING", "10000"))
+
+class ScanLogBuffer:
+    def __init__(self, max_rows: int, flush_seconds: float, max_pending: int):
+        self.max_rows = max_rows
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._rows = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, row: dict) -> None:
+        self._rows.append(row)
+        metrics.incr("scan_log.buffered")
+        if len(self._rows) > self.max_pending:
+            del self._rows[0]
+            metrics.incr("scan_log.dropped")
+        if len(self._rows) >= self.max_rows and self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the flusher after writing every pending row.
+        """
+        if self._task is None:
+            await self.flush()
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        while self._rows:
+            rows, self._rows = self._rows[:self.max_rows], self._rows[self.max_rows:]
+            try:
+                await db.scanlog.create_many(data=rows)
+            except Exception as e:
+                print(f"Error flushing {len(rows)} scan logs: {e}")
+                metrics.incr("scan_log.flush_errors")
+                # Keep them for the next flush, the cap in add() bounds the backlog
+                self._rows[:0] = rows
+                return
+            metrics.incr("scan_log.flushed", len(rows))
+
+scan_log_buffer = ScanLogBuffer(MAX_ROWS, FLUSH_SECONDS, MAX_PENDING)
+metrics.register_gauge("scan_log.pending", lambda: len(scan_log_buffer))
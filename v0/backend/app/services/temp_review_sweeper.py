@@ -0,0 +1,75 @@
+import os
+import time
+import asyncio
+import datetime as dt
+from typing import Optional
+from app.db import db, epoch_ms
+from app.services import metrics
+
+# Deletes TempReview rows past their expiresAt. Reads already treat them as
+# missing; this keeps the table, and the duplicate and similarity checks
+# that scan it, from growing with abandoned drafts. Rows go in batches of
+# BATCH_ROWS through the expiresAt index, with a pause between batches so
+# that each write lock is held only briefly.
+
+SWEEP_SECONDS = float(os.environ.get("TEMP_REVIEW_SWEEP_SECONDS", "60"))
+BATCH_ROWS = int(os.environ.get("TEMP_REVIEW_SWEEP_BATCH_ROWS", "500"))
+BATCH_PAUSE_SECONDS = 0.05
+
+SWEEP_SQL = """
+DELETE FROM "TempReview"
+WHERE "id" IN (
+    SELECT "id" FROM "TempReview" WHERE "expiresAt" <= ? LIMIT ?
+)
+"""
+
+class TempReviewSweeper:
+    def __init__(self, batch_rows: int):
+        self.batch_rows = batch_rows
+        self._task: Optional[asyncio.Task] = None
+        self._rows = 0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def rows(self) -> int:
+        # Table size as of the last sweep
+        return self._rows
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Error sweeping expired temp reviews: {e}")
+            await asyncio.sleep(SWEEP_SECONDS)
+
+    async def sweep(self) -> int:
+        """
+        Deletes every row expired by now and returns how many there were.
+        """
+        cutoff = epoch_ms(dt.datetime.now())
+        started = time.perf_counter()
+        swept = 0
+        while True:
+            deleted = await db.execute_raw(SWEEP_SQL, cutoff, self.batch_rows)
+            swept += deleted
+            if deleted < self.batch_rows:
+                break
+            await asyncio.sleep(BATCH_PAUSE_SECONDS)
+
+        self._rows = await db.tempreview.count()
+        metrics.incr("temp_reviews.swept", swept)
+        metrics.observe("temp_reviews.sweep_seconds", time.perf_counter() - started)
+        if swept:
+            print(f"Swept {swept} expired temp reviews")
+        return swept
+
+temp_review_sweeper = TempReviewSweeper(BATCH_ROWS)
+metrics.register_gauge("temp_reviews.rows", temp_review_sweeper.rows)
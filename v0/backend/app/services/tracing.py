@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import queue
+import random
+import asyncio
+import hashlib
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Optional
+from nanoid import generate as nanoid
+from app.paths import CACHE_ROOT
+from app.services import metrics
+
+# Lightweight request tracing. A trace is one HTTP request or background job;
+# spans nest through a context variable and are written as NDJSON lines by a
+# QueueListener thread, so request handlers never wait on the file. A trace
+# keeps its spans until it ends and is then written or dropped as a whole.
+# Traces that belong to a review job are sampled by jobId, so the scan, job,
+# stream and submit traces of a sampled job are all kept.
+# Summarize with `python trace_summary.py` in the backend directory.
+
+TRACE_FILE = os.environ.get(
+    "TRACE_FILE",
+    os.path.join(CACHE_ROOT, "traces", "spans.ndjson"),
+)
+SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.1"))
+MAX_BYTES = int(os.environ.get("TRACE_MAX_BYTES", str(10 * 1024 * 1024)))
+BACKUP_COUNT = int(os.environ.get("TRACE_BACKUP_COUNT", "5"))
+MAX_PENDING = 10000
+
+class Trace:
+    def __init__(self, sampled: bool, job_id: Optional[str] = None):
+        self.id = nanoid(size=16)
+        self.sampled = sampled
+        self.job_id = job_id
+        self.spans = []
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_span_id: ContextVar[Optional[str]] = ContextVar("span_id", default=None)
+
+_queue: "queue.Queue" = queue.Queue(MAX_PENDING)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def start() -> None:
+    global _listener
+    if SAMPLE_RATE <= 0 or _listener is not None:
+        return
+    os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(TRACE_FILE, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _listener = logging.handlers.QueueListener(_queue, handler)
+    _listener.start()
+
+def stop() -> None:
+    """
+    Writes the spans still queued and closes the file.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+def job_sampled(job_id: str) -> bool:
+    # Same decision in every process for the same job
+    bucket = int(hashlib.sha1(job_id.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return bucket < SAMPLE_RATE
+
+@contextmanager
+def trace(job_id: Optional[str] = None):
+    """
+    Starts a new trace for a request or a background job.
+    """
+    sampled = job_sampled(job_id) if job_id else random.random() < SAMPLE_RATE
+    current = Trace(sampled, job_id)
+    trace_token = _trace.set(current)
+    span_token = _span_id.set(None)
+    try:
+        yield
+    finally:
+        _span_id.reset(span_token)
+        _trace.reset(trace_token)
+        if current.sampled:
+            for record in current.spans:
+                record["jobId"] = current.job_id
+                _write(record)
+
+def bind_job(job_id: str) -> None:
+    """
+    Tags the current trace with a jobId and samples it by that jobId.
+    """
+    current = _trace.get()
+    if current is not None:
+        current.job_id = job_id
+        current.sampled = job_sampled(job_id)
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times the block as a child of the current span. Yields the attribute
+    dict, so the block can add attributes it only learns while running.
+    """
+    current = _trace.get()
+    if current is None or SAMPLE_RATE <= 0:
+        yield attributes
+        return
+
+    span_id = nanoid(size=12)
+    parent_id = _span_id.get()
+    # Restore by value rather than token: spans may close in a different
+    # context, e.g. around a yield in a streaming response
+    _span_id.set(span_id)
+    started, start_time = time.perf_counter(), time.time()
+    error = None
+    cancelled = False
+    try:
+        yield attributes
+    except (GeneratorExit, asyncio.CancelledError):
+        # A client that went away mid-stream, not a failure
+        cancelled = True
+        raise
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _span_id.set(parent_id)
+        current.spans.append({
+            "traceId": current.id,
+            "spanId": span_id,
+            "parentId": parent_id,
+            "name": name,
+            "start": round(start_time, 6),
+            "durationMs": round((time.perf_counter() - started) * 1000, 3),
+            "error": error,
+            **({"cancelled": True} if cancelled else {}),
+            **attributes,
+        })
+
+def _write(record: dict) -> None:
+    if _listener is None:
+        return
+    try:
+        _queue.put_nowait(logging.makeLogRecord({"msg": json.dumps(record, default=str)}))
+    except queue.Full:
+        metrics.incr("tracing.dropped")
+
+class TracingMiddleware:
+    """
+    ASGI middleware that opens a trace and an "http" span per request. The
+    span ends when the response body is finished, so streaming responses are
+    covered in full.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with trace():
+            with span("http", method=scope["method"], path=scope["path"]) as attributes:
+                async def send_with_status(message):
+                    if message["type"] == "http.response.start":
+                        attributes["status"] = message["status"]
+                    await send(message)
+
+                await self.app(scope, receive, send_with_status)
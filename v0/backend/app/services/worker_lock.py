@@ -0,0 +1,38 @@
+import os
+import fcntl
+from typing import Optional
+
+# Elects one of the uvicorn worker processes on a host for a job that must
+# only run once, by an flock on a lock file. The lock goes with the process,
+# so if the holder exits without releasing it another worker can take over.
+
+class WorkerLock:
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        """
+        Tries to take the lock without waiting. Returns whether this process
+        holds it.
+        """
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)  # releases the lock for another worker
+            self._fd = None
@@ -0,0 +1,39 @@
+import time
+import random
+import string
+from app.services.qrcode_generator import build_qr, np
+
+# Encode time (data -> module matrix) per payload size for each mask selection mode.
+# Run from the backend directory: python bench_qr_encode.py
+
+PAYLOAD_SIZES = [30, 60, 120, 250, 500, 1000, 2000]
+MODES = ["library", "numpy", "memo"]
+
+def payloads(size, count):
+    prefix = "http://localhost:3000/visit/"
+    return [prefix + "".join(random.choices(string.ascii_letters + string.digits, k=max(1, size - len(prefix)))) for _ in range(count)]
+
+def bench(mode, data):
+    start = time.perf_counter()
+    for item in data:
+        build_qr(item, mask_selection=mode)
+    return (time.perf_counter() - start) / len(data) * 1000
+
+def main():
+    if np is None:
+        print("numpy is not installed, only the library mask selection is available.")
+        return
+
+    random.seed(42)
+    print(f"{'bytes':>6}{'version':>9}" + "".join(f"{mode + ' ms':>14}" for mode in MODES) + f"{'speedup':>10}")
+    for size in PAYLOAD_SIZES:
+        data = payloads(size, 20 if size <= 500 else 5)
+        # Warm up version templates and the memo with a different payload of the same size
+        for mode in MODES:
+            build_qr(payloads(size, 1)[0], mask_selection=mode)
+        timings = [bench(mode, data) for mode in MODES]
+        version = build_qr(data[0]).version
+        print(f"{size:>6}{version:>9}" + "".join(f"{ms:>14.2f}" for ms in timings) + f"{timings[0] / timings[1]:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import time
+from app.services.qrcode_generator import generate_qr_code_image, np
+
+# Compares the qrcode PIL image factory with the NumPy rasterizer.
+# Run from the backend directory: python bench_qr_render.py
+
+DATA = "http://localhost:3000/visit/qr-V1StGXR8_Z"
+BOX_SIZES = [10, 20, 40, 60, 80, 100]
+COLORS = [("black", "white"), ("#0d1b21", "#ffffff")]
+
+def bench(repeat=20, **kwargs):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        img = generate_qr_code_image(DATA, **kwargs)
+    elapsed = (time.perf_counter() - start) / repeat
+    return elapsed * 1000, len(img)
+
+def main():
+    if np is None:
+        print("numpy is not installed, only the PIL engine is available.")
+        return
+
+    print(f"{'colors':<22}{'box':>5}{'pil ms':>10}{'numpy ms':>10}{'speedup':>9}{'pil KB':>9}{'numpy KB':>10}{'1-bit KB':>10}")
+    for fill_color, back_color in COLORS:
+        for box_size in BOX_SIZES:
+            repeat = 20 if box_size <= 40 else 5
+            colors = dict(fill_color=fill_color, back_color=back_color, box_size=box_size)
+            pil_ms, pil_size = bench(repeat, engine="pil", **colors)
+            np_ms, np_size = bench(repeat, engine="numpy", **colors)
+            _, palette_size = bench(1, engine="numpy", palette=True, **colors)
+            print(
+                f"{fill_color + '/' + back_color:<22}{box_size:>5}{pil_ms:>10.2f}{np_ms:>10.2f}"
+                f"{pil_ms / np_ms:>8.1f}x{pil_size / 1024:>9.1f}{np_size / 1024:>10.1f}{palette_size / 1024:>10.1f}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import time
+import asyncio
+import datetime as dt
+from nanoid import generate as nanoid
+from app.db import db
+from app.api.reviews import move_temp_review
+from app.services.model_router import percentile
+
+# Review submit latency under concurrency: the previous sequential find,
+# create and delete queries against the single batched transaction in
+# move_temp_review. Both leave the ScanLog entry to scan_log_buffer, as
+# submit_review does, so they do the same work.
+# Writes to prisma/dev.db and removes its rows afterwards, so use a copy if
+# the data matters. Run from the backend directory: python bench_submit.py
+
+CONCURRENCY = [1, 8, 32, 128]
+ROUNDS = 3
+
+async def legacy_submit(job_id, review_text):
+    temp_review = await db.tempreview.find_unique(where={"jobId": job_id})
+    review = await db.review.create(data={
+        "qrCodeId": temp_review.qrCodeId,
+        "reviewText": review_text,
+        "language": temp_review.language,
+        "rating": temp_review.rating,
+        "source": "auto-gemini",
+    })
+    await db.tempreview.delete(where={"jobId": job_id})
+    return review
+
+async def batched_submit(job_id, review_text):
+    return await move_temp_review(job_id, review_text)
+
+async def seed(qr_code_id, count):
+    job_ids = [f"bench-{nanoid()}" for _ in range(count)]
+    await db.tempreview.create_many(data=[{
+        "jobId": job_id,
+        "qrCodeId": qr_code_id,
+        "reviewText": "Benchmark review",
+        "language": "english",
+        "rating": 5,
+        "hash": job_id,
+        "expiresAt": dt.datetime.now() + dt.timedelta(minutes=5),
+    } for job_id in job_ids])
+    return job_ids
+
+async def run(submit, qr_code_id, concurrency):
+    latencies = []
+    elapsed = 0.0
+    for _ in range(ROUNDS):
+        job_ids = await seed(qr_code_id, concurrency)
+
+        async def one(job_id):
+            start = time.perf_counter()
+            await submit(job_id, "Benchmark review")
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(job_id) for job_id in job_ids))
+        elapsed += time.perf_counter() - start
+
+    latencies.sort()
+    return percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000, len(latencies) / elapsed
+
+async def cleanup(qr_code_id):
+    # Legacy submits leave Review.jobId empty
+    await db.review.delete_many(where={"OR": [
+        {"jobId": {"startswith": "bench-"}},
+        {"qrCodeId": qr_code_id, "reviewText": "Benchmark review"},
+    ]})
+    await db.tempreview.delete_many(where={"jobId": {"startswith": "bench-"}})
+
+async def main():
+    await db.connect()
+    try:
+        qr_code = await db.qrcode.find_first()
+        if not qr_code:
+            print("No QR codes found; create one first.")
+            return
+
+        print(f"{'concurrent':>10}{'legacy p50':>12}{'p95':>9}{'per s':>9}{'batched p50':>13}{'p95':>9}{'per s':>9}")
+        try:
+            for concurrency in CONCURRENCY:
+                legacy = await run(legacy_submit, qr_code.id, concurrency)
+                batched = await run(batched_submit, qr_code.id, concurrency)
+                print(f"{concurrency:>10}{legacy[0]:>12.1f}{legacy[1]:>9.1f}{legacy[2]:>9.0f}"
+                      f"{batched[0]:>13.1f}{batched[1]:>9.1f}{batched[2]:>9.0f}")
+        finally:
+            await cleanup(qr_code.id)
+    finally:
+        await db.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
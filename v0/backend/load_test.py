@@ -0,0 +1,141 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter, defaultdict
+import httpx
+from app.services.model_router import percentile
+
+# Drives scan -> stream -> submit sessions against a running backend at a
+# target arrival rate and reports per-stage latency, errors and throughput.
+# For offline, repeatable runs start the backend with the stand-in model:
+#   GEMINI_FAKE=1 GEMINI_FAKE_SEED=1 uvicorn app.main:app --port 8001
+#   python load_test.py --rate 5 --duration 60 --seed 1
+# GEMINI_FAKE_LATENCY_MS, GEMINI_FAKE_LATENCY_SIGMA and
+# GEMINI_FAKE_FAILURE_RATE shape the model (see app/services/fake_model.py).
+
+STAGES = ["scan", "first_text", "review_ready", "submit", "session"]
+
+class Results:
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.outcomes = Counter()
+        self.started = 0
+
+    def record(self, stage, seconds):
+        self.durations[stage].append(seconds * 1000)
+
+    def report(self, elapsed):
+        print(f"\n{'stage':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for stage in STAGES:
+            values = sorted(self.durations[stage])
+            if not values:
+                continue
+            print(f"{stage:<16}{len(values):>8}{percentile(values, 50):>10.1f}{percentile(values, 95):>10.1f}"
+                  f"{percentile(values, 99):>10.1f}{values[-1]:>10.1f}")
+
+        completed = self.outcomes["ok"]
+        print(f"\nsessions started: {self.started}, completed: {completed} "
+              f"({completed / elapsed:.2f}/s over {elapsed:.1f}s)")
+        for outcome, count in sorted(self.outcomes.items()):
+            if outcome != "ok":
+                print(f"  {outcome:<28}{count:>6}  ({count / max(1, self.started):.1%})")
+
+async def read_stream(client, base_url, job_id, results, timeout):
+    """
+    Follows /api/reviews/stream until the review is ready. Returns the review
+    text, or an outcome name when the stream ends without one.
+    """
+    opened = time.perf_counter()
+    first_text = False
+    async with client.stream("GET", f"{base_url}/api/reviews/stream", params={"jobId": job_id}, timeout=timeout) as response:
+        if response.status_code != 200:
+            return None, f"stream_http_{response.status_code}"
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            if event["type"] in ("review_delta", "review_ready") and not first_text:
+                first_text = True
+                results.record("first_text", time.perf_counter() - opened)
+            if event["type"] == "review_ready":
+                results.record("review_ready", time.perf_counter() - opened)
+                return event["reviewText"], None
+            if event["type"] in ("error", "timeout"):
+                return None, f"stream_{event['type']}"
+    return None, "stream_closed"
+
+async def session(client, args, qr_id, number, results):
+    started = time.perf_counter()
+    results.started += 1
+    try:
+        response = await client.post(f"{args.base_url}/api/qr/scan", json={
+            "qrId": qr_id,
+            "deviceId": f"load-test-{number % 10}",
+            "sessionId": f"load-test-{number}",
+        })
+        results.record("scan", time.perf_counter() - started)
+        if response.status_code == 503:
+            results.outcomes["scan_rejected_503"] += 1
+            return
+        if response.status_code != 200:
+            results.outcomes[f"scan_http_{response.status_code}"] += 1
+            return
+        job_id = response.json()["jobId"]
+
+        review_text, failure = await read_stream(client, args.base_url, job_id, results, args.stream_timeout)
+        if failure:
+            results.outcomes[failure] += 1
+            return
+
+        submitted = time.perf_counter()
+        response = await client.post(f"{args.base_url}/api/reviews/submit", json={"jobId": job_id, "reviewText": review_text})
+        results.record("submit", time.perf_counter() - submitted)
+        if response.status_code != 200:
+            results.outcomes[f"submit_http_{response.status_code}"] += 1
+            return
+
+        results.record("session", time.perf_counter() - started)
+        results.outcomes["ok"] += 1
+    except httpx.HTTPError as e:
+        results.outcomes[f"transport_{type(e).__name__}"] += 1
+
+async def first_qr_id(client, base_url):
+    response = await client.get(f"{base_url}/api/admin/qr-codes/list")
+    response.raise_for_status()
+    qr_codes = response.json().get("qrCodes", [])
+    if not qr_codes:
+        raise SystemExit("No QR codes found; create one or pass --qr-id")
+    return qr_codes[0]["id"]
+
+async def main():
+    parser = argparse.ArgumentParser(description="Load test the scan -> stream -> submit flow")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--rate", type=float, default=2.0, help="new sessions per second (Poisson arrivals)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep starting sessions")
+    parser.add_argument("--qr-id", help="QR code to scan (default: the first one listed)")
+    parser.add_argument("--seed", type=int, help="seed for the arrival schedule")
+    parser.add_argument("--stream-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    arrivals = random.Random(args.seed)
+    results = Results()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(timeout=30.0, limits=limits) as client:
+        qr_id = args.qr_id or await first_qr_id(client, args.base_url)
+        print(f"Scanning {qr_id} at {args.rate}/s for {args.duration:.0f}s")
+
+        started = time.perf_counter()
+        sessions = []
+        next_arrival = started
+        while next_arrival - started < args.duration:
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            sessions.append(asyncio.create_task(session(client, args, qr_id, len(sessions), results)))
+            next_arrival += arrivals.expovariate(args.rate)
+
+        await asyncio.gather(*sessions)
+        results.report(time.perf_counter() - started)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+from app.services import job_events
+
+# Run from the backend directory: python -m pytest test_job_events.py
+
+def drain(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+def test_review_ready_arrives_after_deltas_overflow():
+    async def scenario():
+        queue = job_events.subscribe("job-full")
+        text = ""
+        for i in range(job_events.SUBSCRIBER_QUEUE_SIZE + 50):
+            text += f"{i} "
+            job_events.publish_text("job-full", text)
+        assert queue.qsize() == job_events.SUBSCRIBER_QUEUE_SIZE
+
+        review = SimpleNamespace(reviewText=text, language="english", rating=5)
+        job_events.publish_ready("job-full", review)
+        job_events.publish_failed("job-full")
+        events = drain(queue)
+        job_events.unsubscribe("job-full", queue)
+        return text, events
+
+    text, events = asyncio.run(scenario())
+    assert [e["type"] for e in events[-2:]] == ["review_ready", "error"]
+    assert events[-2]["reviewText"] == text
+
+def test_lagging_subscriber_catches_up_with_reset():
+    async def scenario():
+        queue = job_events.subscribe("job-lag")
+        text = ""
+        for i in range(job_events.SUBSCRIBER_QUEUE_SIZE + 10):
+            text += f"{i} "
+            job_events.publish_text("job-lag", text)
+        drain(queue)
+
+        text += "end"
+        job_events.publish_text("job-lag", text)
+        events = drain(queue)
+        job_events.unsubscribe("job-lag", queue)
+        return text, events
+
+    text, events = asyncio.run(scenario())
+    assert events == [{"type": "review_delta", "jobId": "job-lag", "text": text, "reset": True}]
@@ -0,0 +1,80 @@
+import os
+import sys
+import glob
+import json
+from collections import defaultdict
+from app.services.model_router import percentile
+from app.services.tracing import TRACE_FILE
+
+# Per-stage latency from the span files written by app/services/tracing.py.
+# Run from the backend directory:
+#   python trace_summary.py [spans.ndjson]     latency per span name
+#   python trace_summary.py --job <jobId>      every span of one review job
+
+def read_spans(path):
+    # Rotated files first (oldest has the highest suffix), then the live one
+    rotated = sorted(glob.glob(f"{path}.*"), key=lambda name: int(name.rsplit(".", 1)[1]) if name.rsplit(".", 1)[1].isdigit() else 0, reverse=True)
+    for name in rotated + [path]:
+        if not os.path.exists(name):
+            continue
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+
+def label(record):
+    if record["name"] == "http":
+        return f"http {record.get('method')} {record.get('path')}"
+    return record["name"]
+
+def summarize(spans):
+    durations = defaultdict(list)
+    errors = defaultdict(int)
+    cancelled = defaultdict(int)
+    for record in spans:
+        name = label(record)
+        durations[name].append(record["durationMs"])
+        if record.get("error"):
+            errors[name] += 1
+        if record.get("cancelled"):
+            cancelled[name] += 1
+
+    print(f"{'span':<44}{'count':>8}{'errors':>8}{'cancel':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        values.sort()
+        print(f"{name[:43]:<44}{len(values):>8}{errors[name]:>8}{cancelled[name]:>8}"
+              f"{percentile(values, 50):>10.1f}{percentile(values, 95):>10.1f}{percentile(values, 99):>10.1f}{values[-1]:>10.1f}")
+
+def show_job(spans, job_id):
+    records = sorted((r for r in spans if r.get("jobId") == job_id), key=lambda r: r["start"])
+    if not records:
+        print(f"No spans for job {job_id} (it may not have been sampled)")
+        return
+
+    children = defaultdict(list)
+    for record in records:
+        children[(record["traceId"], record["parentId"])].append(record)
+
+    origin = records[0]["start"]
+    def show(record, depth):
+        error = f"  ! {record['error']}" if record.get("error") else "  (cancelled)" if record.get("cancelled") else ""
+        print(f"{(record['start'] - origin) * 1000:>9.1f} ms  {'  ' * depth}{label(record)}  {record['durationMs']:.1f} ms{error}")
+        for child in children[(record["traceId"], record["spanId"])]:
+            show(child, depth + 1)
+
+    for record in records:
+        if record["parentId"] is None:
+            show(record, 0)
+
+def main():
+    args = sys.argv[1:]
+    if args[:1] == ["--job"] and len(args) >= 2:
+        path = args[2] if len(args) > 2 else TRACE_FILE
+        show_job(list(read_spans(path)), args[1])
+    else:
+        summarize(read_spans(args[0] if args else TRACE_FILE))
+
+if __name__ == "__main__":
+    main()
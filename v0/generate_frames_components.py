@@ -1,12 +1,16 @@
 
 import os
 import re
+import sys
+import json
 import math
 import xml.etree.ElementTree as ET
 
 # Configuration
 FRAMES_DIR = "Frames "  # Note the space at the end
 OUTPUT_FILE = "components/generated-qr-frames.tsx"
+MANIFEST_DIR = "frames"
+MANIFEST_FILE = "frames/manifest.json"
 
 def parse_style(style_str):
     """
@@ -569,5 +573,54 @@ export const GENERATED_FRAMES = [
     
     print(f"Successfully generated {len(frame_definitions)} frames into {OUTPUT_FILE}")
 
+def write_frames_manifest(frames_dir=MANIFEST_DIR, output_file=MANIFEST_FILE):
+    """
+    Writes the QR placement of every SVG in frames_dir as JSON, so the backend
+    can composite framed QR codes without a browser.
+    """
+    frames = []
+
+    for file in sorted(os.listdir(frames_dir)):
+        if not file.endswith(".svg"):
+            continue
+        frame_label = os.path.splitext(file)[0]
+
+        with open(os.path.join(frames_dir, file), 'r', encoding='utf-8') as f:
+            svg_content = f.read()
+        svg_content = re.sub(r'<\?xml.*?\?>', '', svg_content)
+        svg_content = re.sub(r'<!--.*?-->', '', svg_content, flags=re.DOTALL)
+
+        try:
+            xml_root = ET.fromstring(svg_content)
+        except ET.ParseError:
+            print(f"Error parsing XML for {file}")
+            continue
+
+        viewBox = xml_root.attrib.get('viewBox', '0 0 200 200')
+        style_map = {}
+        for elem in xml_root.iter():
+            if elem.tag.endswith('style') and elem.text:
+                style_map.update(parse_style(elem.text))
+
+        placement = get_qr_placement(xml_root, viewBox, style_map, frame_id=frame_label) or (20, 20, 60, 60)
+        l, t, w, h = placement
+
+        frames.append({
+            "id": "frame-" + re.sub(r'[^a-zA-Z0-9]', '', frame_label).lower(),
+            "file": file,
+            "viewBox": [float(x) for x in viewBox.split()],
+            # Percentages of the viewBox, like the qr_style of the generated components
+            "qrArea": {"left": round(l, 2), "top": round(t, 2), "width": round(w, 2), "height": round(h, 2)},
+        })
+
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump({"frames": frames}, f, indent=2)
+        f.write("\n")
+
+    print(f"Wrote placement for {len(frames)} frames into {output_file}")
+
 if __name__ == "__main__":
-    process_frames()
+    if "--manifest" in sys.argv:
+        write_frames_manifest()
+    else:
+        process_frames()